@@ -0,0 +1,457 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Any, List, Mapping, Optional, Set, Tuple, TypeVar
+from urllib.parse import quote_plus
+
+import aiohttp
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+from tqdm import tqdm
+
+import availability_checker as checker
+import circuit_breaker
+import http_client
+import metrics
+from host_scheduler import HOST_LIMITS, host_of, interleave_by_host
+from cache_manager import CheckResultStore
+from circuit_breaker import CircuitOpenError
+from decorators import stage_logger
+from playwright_utils import BROWSER_ARGS, CONTEXT_OPTIONS, browser_pool, lean_block_estimate, record_lean_block
+from orchestrator import (SUBMIT_WINDOW_PER_WORKER, UNKNOWN_PUBLISHER, UNKNOWN_PIRATES, UNKNOWN_RESEARCHGATE,
+                          log_check_failure, unknown_checks)
+from utils import normalize_item
+from work import Work
+
+T = TypeVar("T")
+
+class AsyncBrowser:
+    """
+    Один браузер на весь асинхронный этап 3.
+    Запускается лениво при первой проверке, число одновременно открытых
+    страниц ограничено семафором max_pages.
+    """
+    def __init__(self, headless: bool = False, max_pages: int = 16):
+        self.headless = headless
+        self._pages = asyncio.Semaphore(max_pages)
+        self._lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        # свободные страницы для повторного использования: обычные и облегчённые
+        self._free: Dict[bool, List[Any]] = {False: [], True: []}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._context:
+            await self._context.close()
+        if self._browser:
+            await self._browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+
+    async def _ensure_started(self) -> None:
+        async with self._lock:
+            if self._context is None:
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=self.headless, args=BROWSER_ARGS)
+                metrics.inc("browser.launches")
+                self._context = await self._browser.new_context(**CONTEXT_OPTIONS)
+                self._context.set_default_timeout(30000)
+
+    @asynccontextmanager
+    async def page(self, lean: bool = False):
+        """Асинхронный аналог playwright_utils.BrowserSession.page"""
+        async with self._pages:
+            await self._ensure_started()
+            free: List[Any] = self._free[lean]
+            page = None
+            while free and page is None:
+                candidate = free.pop()
+                if not candidate.is_closed():
+                    page = candidate
+            if page is None:
+                page = await self._context.new_page()
+                if lean:
+                    await page.route("**/*", _lean_route)
+            else:
+                metrics.inc("browser.pages_reused")
+            if lean:
+                metrics.inc("browser.lean.pages")
+
+            try:
+                yield page
+            except BaseException:
+                await page.close()
+                raise
+            # страниц не больше, чем мест семафора, поэтому пул не растёт неограниченно
+            free.append(page)
+
+class _AsyncHostGate:
+    """Асинхронный аналог host_scheduler._HostGate (все задачи в одном потоке, блокировка не нужна)"""
+    def __init__(self, concurrency: int, min_interval: float):
+        self.slots = asyncio.Semaphore(max(1, int(concurrency)))
+        self.min_interval = min_interval
+        self.next_start = 0.0
+
+    async def wait_turn(self) -> None:
+        if self.min_interval <= 0:
+            return
+        now = time.monotonic()
+        start = max(now, self.next_start)
+        self.next_start = start + self.min_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+# Места хостов текущего запуска этапа; семафоры asyncio привязаны к циклу событий,
+# поэтому stage_process_dois_async создаёт их заново
+_host_gates: Dict[str, _AsyncHostGate] = {}
+
+@asynccontextmanager
+async def host_slot(url: str):
+    """Асинхронный аналог host_scheduler.host_slot с теми же ограничениями HOST_LIMITS"""
+    host = host_of(url)
+    gate = _host_gates.get(host)
+    if gate is None:
+        limits = HOST_LIMITS.get(host, HOST_LIMITS["default"])
+        gate = _host_gates[host] = _AsyncHostGate(limits.get("concurrency", 4),
+                                                  limits.get("min_interval", 0.0))
+    if gate.slots.locked():
+        metrics.inc("host_scheduler.waits")
+    async with gate.slots:
+        await gate.wait_turn()
+        with metrics.timer("host_seconds", host=host):
+            yield
+
+async def _lean_route(route) -> None:
+    saved: Optional[int] = lean_block_estimate(route.request.resource_type, route.request.url)
+    if saved is None:
+        await route.continue_()
+        return
+    record_lean_block(saved)
+    await route.abort()
+
+async def call_with_breaker(url: str, request: Callable[[], Awaitable[T]],
+                            is_failure: Callable[[T], bool] = lambda result: False) -> T:
+    """
+    Асинхронный аналог circuit_breaker.call: повторяется только один запрос,
+    сбои учитываются предохранителем хоста url (общим с потоковым движком).
+    """
+    host = host_of(url)
+    for attempt in range(circuit_breaker.RETRIES):
+        if not circuit_breaker.allow(host):
+            metrics.inc("circuit_breaker.rejected")
+            raise CircuitOpenError(host)
+        try:
+            result: T = await request()
+        except Exception as e:
+            metrics.inc(f"request_errors.{type(e).__name__}")
+            circuit_breaker.record_failure(host)
+            if attempt == circuit_breaker.RETRIES - 1:
+                raise
+        else:
+            if not is_failure(result):
+                circuit_breaker.record_success(host)
+                return result
+            circuit_breaker.record_failure(host)
+            if attempt == circuit_breaker.RETRIES - 1:
+                return result
+        metrics.inc("retries.requests")
+        await asyncio.sleep(circuit_breaker.RETRY_DELAY * (attempt + 1) * random.uniform(0.8, 1.2))
+    raise RuntimeError("unreachable")
+
+async def probe_pdf_http(http: aiohttp.ClientSession, url: str) -> Optional[bool]:
+    """Асинхронный аналог availability_checker.probe_pdf_http (CircuitOpenError, если хост отключён)"""
+    headers = {"Range": f"bytes=0-{checker.PDF_PROBE_BYTES - 1}"}
+
+    async def _request() -> Tuple[int, Optional[bool]]:
+        async with host_slot(url), \
+                http.get(url, headers=headers, allow_redirects=True,
+                         timeout=aiohttp.ClientTimeout(total=checker.PDF_PROBE_TIMEOUT)) as r:
+            head: bytes = await r.content.read(checker.PDF_PROBE_BYTES)
+            return r.status, checker.classify_pdf_probe(url, str(r.url), r.status,
+                                                        r.headers.get("Content-Type", ""), head)
+
+    try:
+        return (await call_with_breaker(url, _request,
+                                        is_failure=lambda r: checker.is_transient_status(r[0])))[1]
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+
+async def _goto(page, url: str) -> Optional[str]:
+    """Асинхронный аналог availability_checker._goto"""
+    try:
+        async with host_slot(url):
+            await page.goto(url, timeout=20000, wait_until="domcontentloaded")
+    except PlaywrightError as e:
+        if "ERR_ABORTED" in str(e) or "Download is starting" in str(e):
+            return None
+        raise
+    return page.url.strip()
+
+async def browser_pdf_check(browser: AsyncBrowser, pdf_links: List[str]) -> Optional[bool]:
+    """Асинхронный аналог availability_checker.browser_pdf_check"""
+    skipped = False
+    async with browser.page(browser_pool.is_lean("publisher")) as page:
+        for url in pdf_links:
+            try:
+                final_url: Optional[str] = await call_with_breaker(url, lambda: _goto(page, url))
+            except CircuitOpenError:
+                skipped = True
+                continue
+            except Exception:
+                continue
+
+            if final_url is not None and final_url.lower() == url.lower():
+                return True
+    return None if skipped else False
+
+async def publisher_availability(http: aiohttp.ClientSession, browser: AsyncBrowser,
+                                 item: Work) -> Dict[str, Any]:
+    """
+    Асинхронный аналог availability_checker.publisher_availability:
+    HTTP-проверки ссылок идут одновременно.
+    """
+    links = [url for url, _ in item.links]
+    pdf_links = checker.select_pdf_links(item)
+
+    has_pdf: Optional[bool] = False
+    tier = "none"
+    browser_links = pdf_links
+    skipped = False
+
+    if pdf_links and checker.HTTP_FAST_PATH:
+        tier = "http"
+        verdicts = await asyncio.gather(*(probe_pdf_http(http, url) for url in pdf_links),
+                                        return_exceptions=True)
+        for verdict in verdicts:
+            if isinstance(verdict, CircuitOpenError):
+                skipped = True
+            elif isinstance(verdict, BaseException):
+                raise verdict
+        has_pdf = any(verdict is True for verdict in verdicts)
+        browser_links = [] if has_pdf else [
+            url for url, verdict in zip(pdf_links, verdicts) if verdict is None
+        ]
+
+    if browser_links:
+        tier = "browser"
+        has_pdf = await browser_pdf_check(browser, browser_links)
+
+    if not has_pdf and skipped:
+        has_pdf = None
+    if has_pdf is None:
+        tier = "circuit_open"
+
+    metrics.inc(f"publisher_tier.{tier}")
+    return {
+        "publisher_pdf": has_pdf,
+        "publisher_links": links,
+        "publisher_tier": tier
+    }
+
+async def _pirate_base(http: aiohttp.ClientSession, base: str, doi: str) -> Optional[bool]:
+    # None — ресурс отключён предохранителем или ни один URL не дал окончательного ответа
+    # (см. availability_checker.check_pirates)
+    ok: Optional[bool] = None
+    for u in checker.pirate_candidates(base, quote_plus(doi)):
+        async def _request(u: str = u) -> Tuple[int, str]:
+            async with host_slot(u), \
+                    http.get(u, timeout=aiohttp.ClientTimeout(total=http_client.timeout("availability"))) as r:
+                return r.status, await r.text(errors="replace")
+        try:
+            status, text = await call_with_breaker(
+                u, _request, is_failure=lambda r: checker.is_transient_status(r[0])
+            )
+            if checker.pirate_hit(status, text, doi):
+                return True
+            if not checker.is_transient_status(status):
+                ok = False
+        except CircuitOpenError:
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            continue
+    return ok
+
+async def check_pirates(http: aiohttp.ClientSession, doi: str,
+                        pirate_bases: Optional[List[str]]) -> Dict[str, Any]:
+    """Асинхронный аналог availability_checker.check_pirates: все ресурсы опрашиваются одновременно"""
+    if not pirate_bases:
+        return {"pirates": {}, "pirates_any": False}
+
+    found = await asyncio.gather(*(_pirate_base(http, base, doi) for base in pirate_bases))
+    details = dict(zip(pirate_bases, found))
+    found_any: Optional[bool] = True if any(found) else (None if None in found else False)
+    return {"pirates": details, "pirates_any": found_any}
+
+async def check_researchgate(browser: AsyncBrowser, title: str, doi: str) -> str:
+    """Асинхронный аналог availability_checker.check_researchgate"""
+    url = checker.RESEARCHGATE_SEARCH_URL + quote_plus(title)
+    try:
+        async with browser.page(browser_pool.is_lean("researchgate")) as page:
+            await asyncio.sleep(random.uniform(0.1, 0.3))
+
+            async def _search() -> bool:
+                async with host_slot(url):
+                    await page.goto(url, timeout=40000)
+                    # предохранитель и повторы касаются только навигации, не ожидания результатов
+                    try:
+                        await page.wait_for_selector(checker.RESEARCHGATE_RESULT_SELECTOR, timeout=20000)
+                    except PlaywrightTimeoutError:
+                        return False
+                    return True
+
+            if not await call_with_breaker(url, _search):
+                metrics.inc("timeouts.researchgate")
+                return "unknown"
+            content = (await page.content()).lower()
+            return "yes" if doi.lower() in content else "no"
+    except CircuitOpenError:
+        return "unknown"
+    except PlaywrightTimeoutError:
+        metrics.inc("timeouts.researchgate")
+        return "unknown"
+    except Exception as e:
+        print(f"Error checking ResearchGate for {doi}: {e}")
+        return "unknown"
+
+async def run_check(result_store: Optional[CheckResultStore], doi: str, check_type: str,
+                    check: Callable[[], Awaitable[T]],
+                    reusable: Callable[[T], bool] = lambda v: True) -> T:
+    """Асинхронный аналог orchestrator.run_check"""
+    if result_store is not None:
+        cached: Optional[T] = result_store.get_fresh(doi, check_type)
+        if cached is not None and reusable(cached):
+            metrics.inc(f"result_cache.hit.{check_type}")
+            return cached
+        metrics.inc(f"result_cache.miss.{check_type}")
+
+    with metrics.timer("check_seconds", check=check_type):
+        value: T = await check()
+    if result_store is not None and reusable(value):
+        result_store.put(doi, check_type, value)
+    return value
+
+async def process_single_doi_item(http: aiohttp.ClientSession, browser: AsyncBrowser,
+                                  doi: str, raw_data: Work,
+                                  pirate_urls: List[str], check_rg: bool,
+                                  result_store: Optional[CheckResultStore] = None,
+                                  deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Асинхронный аналог orchestrator.process_single_doi_item.
+    Проверки одного DOI выполняются одновременно, результат нормализуется тем же normalize_item.
+    Проверки, не завершившиеся за deadline секунд или завершившиеся исключением,
+    получают значение "unknown"; незавершённые отменяются.
+    """
+    async def _pirates() -> Dict[str, Any]:
+        if not pirate_urls:
+            return {"pirates_any": False, "pirates": {}}
+        return await run_check(
+            result_store, doi, "pirates", lambda: check_pirates(http, doi, pirate_urls),
+            reusable=lambda v: set(v.get("pirates", {})) == set(pirate_urls)
+                               and v.get("pirates_any") is not None
+        )
+
+    async def _rg() -> str:
+        if not check_rg:
+            return "not_checked"
+        return await run_check(
+            result_store, doi, "researchgate",
+            lambda: check_researchgate(browser, raw_data.title, doi),
+            reusable=lambda v: v != "unknown"
+        )
+
+    tasks = {
+        "publisher": asyncio.ensure_future(run_check(
+            result_store, doi, "publisher", lambda: publisher_availability(http, browser, raw_data),
+            reusable=lambda v: v.get("publisher_pdf") is not None
+        )),
+        "pirates": asyncio.ensure_future(_pirates()),
+        "researchgate": asyncio.ensure_future(_rg())
+    }
+    await asyncio.wait(tasks.values(), timeout=deadline)
+
+    values: Dict[str, Any] = {}
+    for name, task in tasks.items():
+        if task.done():
+            try:
+                values[name] = task.result()
+            except Exception as e:
+                log_check_failure(doi, name, e)
+        else:
+            task.cancel()
+            metrics.inc(f"deadline_exceeded.{name}")
+
+    pub_av: Dict[str, Any] = values.get("publisher", dict(UNKNOWN_PUBLISHER))
+    pirates: Dict[str, Any] = values.get("pirates", dict(UNKNOWN_PIRATES))
+    rg: str = values.get("researchgate", UNKNOWN_RESEARCHGATE)
+    return normalize_item(doi, raw_data, pub_av, pirates, rg)
+
+@stage_logger("Stage 3: Processing DOIs (async)")
+async def stage_process_dois_async(dois_data: Mapping[str, Work], pirate_urls: List[str],
+                                   check_rg: bool, concurrency: int = 200,
+                                   browser_pages: int = 16,
+                                   headless: bool = False,
+                                   result_store: Optional[CheckResultStore] = None,
+                                   sink: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                   deadline: Optional[float] = None,
+                                   window: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Асинхронный движок этапа 3: до concurrency DOI обрабатываются одновременно
+    в одном потоке, браузерные проверки дополнительно ограничены browser_pages.
+    Как и в orchestrator.stage_process_dois, DOI подаются вперемешку по хостам издателей,
+    а обращения к каждому хосту ограничены host_scheduler.HOST_LIMITS (см. host_slot).
+    Готовые результаты передаются в sink так же, как в orchestrator.stage_process_dois.
+    Задачи создаются по мере завершения предыдущих: одновременно их не больше window
+    (по умолчанию SUBMIT_WINDOW_PER_WORKER * concurrency), поэтому память не растёт с числом DOI.
+    """
+    results = []
+    limit = asyncio.Semaphore(concurrency)
+    window = max(concurrency, window or SUBMIT_WINDOW_PER_WORKER * concurrency)
+    _host_gates.clear()
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+
+    async with aiohttp.ClientSession(connector=connector, headers=http_client.HEADERS) as http, \
+            AsyncBrowser(headless=headless, max_pages=browser_pages) as browser:
+
+        async def _run(doi: str, raw_data: Work) -> Dict[str, Any]:
+            async with limit:
+                try:
+                    return await process_single_doi_item(http, browser, doi, raw_data,
+                                                         pirate_urls, check_rg, result_store, deadline)
+                except Exception as e:
+                    # как в orchestrator.stage_process_dois: сбойный DOI выгружается с "unknown"
+                    print(f"Error processing {doi}: {e}")
+                    metrics.inc("stage3.failed")
+                    return normalize_item(doi, raw_data, *unknown_checks(pirate_urls, check_rg))
+
+        # соседние задачи по возможности обращаются к разным издателям
+        ordered = interleave_by_host(dois_data.items(), lambda pair: checker.primary_host(pair[1]))
+        pending: Set[asyncio.Task] = set()
+        peak = 0
+
+        with tqdm(total=len(dois_data), ncols=100) as pbar:
+            while True:
+                for doi, raw_data in ordered:
+                    pending.add(asyncio.create_task(_run(doi, raw_data)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                peak = max(peak, len(pending))
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result: Dict[str, Any] = task.result()
+                    if sink is not None:
+                        sink(result)
+                    else:
+                        results.append(result)
+                    pbar.update(1)
+
+        metrics.set_value("stage3.submit_window", window)
+        metrics.set_value("stage3.peak_pending", peak)
+
+    return results
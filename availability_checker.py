@@ -1,128 +1,286 @@
 import requests
 from urllib.parse import quote_plus
-from typing import Dict, Any, List, Optional, final
-from decorators import retry_on_failure
-from playwright_utils import BrowserSession
-from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from typing import Dict, Any, List, Optional, Tuple
+from work import Work
+from playwright_utils import browser_pool
+import circuit_breaker
+from circuit_breaker import CircuitOpenError
+import http_client
+import metrics
+from host_scheduler import host_of, host_slot
 import time
 import random
 
-REQUEST_TIMEOUT = 3
-HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; CyberParser/1.0)"}
+RESEARCHGATE_SEARCH_URL = "https://www.researchgate.net/search/publication?q="
+RESEARCHGATE_RESULT_SELECTOR = ".nova-legacy-v-publication-item__stack"
 
-@retry_on_failure()
-def publisher_availability(item: Dict[str, Any]) -> Dict[str, Any]:
+# Быстрая HTTP-проверка PDF перед запуском браузера
+HTTP_FAST_PATH = True
+PDF_PROBE_TIMEOUT = 10
+PDF_PROBE_BYTES = 1024
+
+def configure(cfg: Dict[str, Any]) -> None:
+    """Применяет настройки проверок из секции "availability" конфигурации"""
+    global HTTP_FAST_PATH, PDF_PROBE_TIMEOUT, RESEARCHGATE_SEARCH_URL
+    HTTP_FAST_PATH = cfg.get("http_fast_path", HTTP_FAST_PATH)
+    PDF_PROBE_TIMEOUT = cfg.get("pdf_probe_timeout", PDF_PROBE_TIMEOUT)
+    RESEARCHGATE_SEARCH_URL = cfg.get("researchgate_search_url", RESEARCHGATE_SEARCH_URL)
+
+def classify_pdf_probe(url: str, final_url: str, status: int,
+                       content_type: str, head: bytes) -> Optional[bool]:
+    """
+    Интерпретирует ответ на ranged GET к ссылке на PDF.
+    Возвращает:
+      - True: сервер отдал PDF (сигнатура %PDF или Content-Type)
+      - False: ссылка точно не ведёт на PDF (404/410 или редирект на HTML-страницу)
+      - None: ответ неоднозначен (403, 429, JS-проверка, HTML без редиректа) — нужен браузер
+    """
+    content_type = content_type.lower()
+    if status in (200, 206):
+        if head.lstrip().startswith(b"%PDF") or "application/pdf" in content_type:
+            return True
+        if "html" in content_type and final_url.rstrip("/").lower() != url.rstrip("/").lower():
+            # то же правило, что и в браузере: редирект с PDF-ссылки означает отсутствие PDF
+            return False
+        return None
+    if status in (404, 410):
+        return False
+    return None
+
+def select_pdf_links(work: Work) -> List[str]:
+    """Отбирает из массива link CrossRef непустые ссылки, похожие на PDF"""
+    return [
+        url.strip() for url, content_type in work.links
+        if url.strip() and (url.lower().endswith(".pdf") or "pdf" in content_type.lower())
+    ]
+
+def primary_host(work: Work) -> str:
+    """Хост, к которому в первую очередь обратится проверка издателя"""
+    pdf_links = select_pdf_links(work)
+    return host_of(pdf_links[0] if pdf_links else work.url)
+
+def pirate_candidates(base: str, doi_q: str) -> List[str]:
+    """Формирует возможные URL поиска DOI на пиратском ресурсе"""
+    if base.endswith("=") or base.endswith("/"):
+        return [base + doi_q]
+    return [base + "/" + doi_q, base + "?q=" + doi_q]
+
+def pirate_hit(status: int, text: str, doi: str) -> bool:
+    """Статья считается найденной, если ответ 200 и в HTML есть DOI или PDF"""
+    if status != 200:
+        return False
+    text = text.lower()
+    return doi.lower() in text or ".pdf" in text
+
+def is_transient_status(status: int) -> bool:
+    """Ответ, который ничего не говорит о наличии статьи: сбой сервера или ограничение частоты"""
+    return status >= 500 or status == 429
+
+def _is_server_error(response: Tuple[int, Optional[bool]]) -> bool:
+    return is_transient_status(response[0])
+
+def probe_pdf_http(url: str) -> Optional[bool]:
+    """
+    Проверяет ссылку на PDF обычным HTTP-запросом с Range: bytes=0-1023.
+    Сетевые ошибки и ответы 5xx/429 повторяются и учитываются предохранителем хоста;
+    если хост отключён, выбрасывается CircuitOpenError.
+    """
+    headers = {**http_client.HEADERS, "Range": f"bytes=0-{PDF_PROBE_BYTES - 1}"}
+
+    def _request() -> Tuple[int, Optional[bool]]:
+        with host_slot(url), http_client.get(url, headers=headers, timeout=PDF_PROBE_TIMEOUT,
+                                             allow_redirects=True, stream=True) as r:
+            head: bytes = next(r.iter_content(PDF_PROBE_BYTES), b"")
+            return r.status_code, classify_pdf_probe(url, r.url, r.status_code,
+                                                     r.headers.get("Content-Type", ""), head)
+
+    try:
+        return circuit_breaker.call(url, _request, is_failure=_is_server_error)[1]
+    except requests.RequestException:
+        return None
+
+def _goto(page, url: str) -> Optional[str]:
+    """
+    Открывает url и возвращает итоговый адрес страницы.
+    Прерванная навигация (скачивание файла вместо страницы) — ответ сервера,
+    а не сбой хоста, поэтому для неё возвращается None без повторов.
+    """
+    from playwright.sync_api import Error as PlaywrightError
+
+    try:
+        with host_slot(url):
+            page.goto(url, timeout=20000, wait_until="domcontentloaded")
+    except PlaywrightError as e:
+        if "ERR_ABORTED" in str(e) or "Download is starting" in str(e):
+            return None
+        raise
+    return page.url.strip()
+
+def browser_pdf_check(pdf_links: List[str]) -> Optional[bool]:
+    """
+    Открывает ссылки в браузере: PDF есть, если страница не перенаправила на другой URL.
+    Возвращает None, если PDF не найден, а часть ссылок не проверена из-за отключённого хоста.
+    Выполняется в потоке пула браузеров (см. BrowserPool.run).
+    """
+    return browser_pool.run(_browser_pdf_check, pdf_links)
+
+def _browser_pdf_check(pdf_links: List[str]) -> Optional[bool]:
+    skipped = False
+    with browser_pool.lease() as session, session.page(browser_pool.is_lean("publisher")) as page:
+        for url in pdf_links:
+            try:
+                final_url: Optional[str] = circuit_breaker.call(url, lambda: _goto(page, url))
+            except CircuitOpenError:
+                skipped = True
+                continue
+            except Exception:
+                continue
+
+            if final_url is not None and final_url.lower() == url.lower():
+                return True
+    return None if skipped else False
+
+def publisher_availability(item: Work) -> Dict[str, Any]:
     """
     Проверяет доступность статьи на сайте издателя.
+    Сначала ссылки проверяются HTTP-запросом, браузер запускается только
+    для ссылок с неоднозначным ответом. Ссылки на отключённые предохранителем хосты
+    пропускаются; если PDF не найден среди остальных, результат неизвестен.
     Возвращает словарь с признаками:
-      - publisher_pdf: есть ли PDF у издателя
-      - open_access: опубликована ли статья в открытом доступе
+      - publisher_pdf: есть ли PDF у издателя (None — неизвестно)
       - publisher_links: список доступных ссылок от издателя
+      - publisher_tier: каким способом получен ответ ("none", "http", "browser" или "circuit_open")
     """
-    links = item.get("link", [])
-    pdf_links = [
-        l for l in links
-        if l.get("URL", "").lower().endswith(".pdf")
-        or "pdf" in l.get("content-type", "").lower()
-    ]
-
-    has_pdf = False
+    links = [url for url, _ in item.links]
+    pdf_links = select_pdf_links(item)
 
-    if pdf_links:
-        with BrowserSession(headless=False) as session:
-            page = session.context.new_page()
+    has_pdf: Optional[bool] = False
+    tier = "none"
+    browser_links = pdf_links
+    skipped = False
 
-            for l in pdf_links:
-                url = l.get("URL", "").strip()
-                if not url:
-                    continue
-                try:
-                    page.goto(url, timeout=20000, wait_until="domcontentloaded")
+    if pdf_links and HTTP_FAST_PATH:
+        tier = "http"
+        browser_links = []
+        for url in pdf_links:
+            try:
+                verdict: Optional[bool] = probe_pdf_http(url)
+            except CircuitOpenError:
+                skipped = True
+                continue
+            if verdict:
+                has_pdf = True
+                browser_links = []
+                break
+            if verdict is None:
+                browser_links.append(url)
 
-                    final_url = page.url.strip()
+    if browser_links:
+        tier = "browser"
+        has_pdf = browser_pdf_check(browser_links)
 
-                    if final_url.lower() == url.lower():
-                        has_pdf = True
-                        break
-                except Exception as e:
-                    continue
+    if not has_pdf and skipped:
+        has_pdf = None
+    if has_pdf is None:
+        tier = "circuit_open"
 
+    metrics.inc(f"publisher_tier.{tier}")
     return {
         "publisher_pdf": has_pdf,
-        "publisher_links": links
+        "publisher_links": links,
+        "publisher_tier": tier
     }
 
-@retry_on_failure()
 def check_pirates(doi: str, pirate_bases: Optional[List[str]]) -> Dict[str, Any]:
     """
     Проверяет наличие статьи по DOI на пиратских ресурсах.
     Для каждого ресурса формируются возможные URL-запросы.
     Если ответ 200 и в HTML содержится DOI или PDF — статья считается найденной.
     Возвращает словарь:
-      - pirates: словарь {ресурс: True/False}
-      - pirates_any: общий флаг (нашлась ли где-либо)
+      - pirates: словарь {ресурс: True/False/None}, None — ресурс отключён предохранителем
+        или ни один его URL не дал окончательного ответа (только ошибки сети, 5xx и 429)
+      - pirates_any: общий флаг (нашлась ли где-либо); None, если не нашлась,
+        но часть ресурсов не проверена
     """
     if not pirate_bases:
         return {"pirates": {}, "pirates_any": False}
 
     doi_q: str = quote_plus(doi)
-    found_any = False
-    details = {}
+    details: Dict[str, Optional[bool]] = {}
 
     for base in pirate_bases:
-        ok = False
-        candidates = []
-
-        if base.endswith("=") or base.endswith("/"):
-            candidates.append(base + doi_q)
-        else:
-            candidates.append(base + "/" + doi_q)
-            candidates.append(base + "?q=" + doi_q)
+        ok: Optional[bool] = None
 
-        for u in candidates:
+        for u in pirate_candidates(base, doi_q):
+            def _request(u: str = u) -> requests.Response:
+                with host_slot(u):
+                    return http_client.get(u, headers=http_client.HEADERS,
+                                           timeout=http_client.timeout("availability"))
             try:
-                r: requests.Response = requests.get(u, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-                if r.status_code == 200 and doi.lower() in r.text.lower():
-                    ok = True
-                    break
-                if r.status_code == 200 and ".pdf" in r.text.lower():
+                r: requests.Response = circuit_breaker.call(
+                    u, _request, is_failure=lambda r: is_transient_status(r.status_code)
+                )
+                if pirate_hit(r.status_code, r.text, doi):
                     ok = True
                     break
+                if not is_transient_status(r.status_code):
+                    ok = False
+            except CircuitOpenError:
+                ok = None
+                break
             except (requests.RequestException, ConnectionError, TimeoutError):
                 continue
 
         details[base] = ok
-        if ok:
-            found_any = True
 
+    found = list(details.values())
+    found_any: Optional[bool] = True if any(found) else (None if None in found else False)
     return {"pirates": details, "pirates_any": found_any}
 
-@retry_on_failure()
 def check_researchgate(title: str, doi: str) -> str:
     """
     Проверяет наличие статьи по DOI на ResearchGate.
     Возможные результаты:
       - "yes": статья точно найдена
       - "maybe": страница открылась, но DOI не найден в HTML
-      - "unknown": ошибка или сайт недоступен
+      - "unknown": ошибка, сайт недоступен или отключён предохранителем
+    Выполняется в потоке пула браузеров (см. BrowserPool.run).
     """
-    with BrowserSession(headless=False) as session:
-        try:
-            page = session.context.new_page()
-            url = f"https://www.researchgate.net/search/publication?q={quote_plus(title)}"
+    return browser_pool.run(_check_researchgate, title, doi)
+
+def _check_researchgate(title: str, doi: str) -> str:
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    url = RESEARCHGATE_SEARCH_URL + quote_plus(title)
 
+    with browser_pool.lease() as session, session.page(browser_pool.is_lean("researchgate")) as page:
+        try:
             time.sleep(random.uniform(0.1, 0.3))
 
-            page.goto(url, timeout=40000)
-            page.wait_for_selector(".nova-legacy-v-publication-item__stack", timeout=20000)
+            def _search() -> bool:
+                with host_slot(url):
+                    page.goto(url, timeout=40000)
+                    # нет результатов или капча — ответ сайта, а не сбой хоста:
+                    # предохранитель и повторы касаются только навигации
+                    try:
+                        page.wait_for_selector(RESEARCHGATE_RESULT_SELECTOR, timeout=20000)
+                    except PlaywrightTimeoutError:
+                        return False
+                    return True
 
+            if not circuit_breaker.call(url, _search):
+                metrics.inc("timeouts.researchgate")
+                return "unknown"
             content = page.content().lower()
 
             if doi.lower() in content:
                 return "yes"
             else:
                 return "no"
+        except CircuitOpenError:
+            return "unknown"
         except PlaywrightTimeoutError:
+            metrics.inc("timeouts.researchgate")
             return "unknown"
         except Exception as e:
             print(f"Error checking ResearchGate for {doi}: {e}")
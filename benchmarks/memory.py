@@ -0,0 +1,109 @@
+"""
+Сравнение памяти: словарь «сырых» элементов CrossRef против словаря записей Work,
+и время построчной нормализации (Work.from_item + utils.normalize_item) на --normalize-count записях.
+
+Запуск из корня проекта:
+    python -m benchmarks.memory --count 20000 --normalize-count 100000
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from typing import Dict, Any, Callable, Tuple
+
+from utils import normalize_item
+from work import Work
+
+def synthetic_item(i: int) -> Dict[str, Any]:
+    """Элемент, по структуре и размеру похожий на полный ответ CrossRef /works"""
+    doi = f"10.{1000 + i % 9000}/bench.{i}"
+    return {
+        "DOI": doi,
+        "URL": f"https://doi.org/{doi}",
+        "title": [f"Detection of low-rate denial of service attacks, part {i}"],
+        "author": [
+            {"given": f"Given{j}", "family": f"Family{j}", "sequence": "additional",
+             "affiliation": [{"name": f"University {j}, Department of Computer Science"}]}
+            for j in range(random.randint(1, 6))
+        ],
+        "published": {"date-parts": [[2025, 1 + i % 12, 1 + i % 28]]},
+        "issued": {"date-parts": [[2025, 1 + i % 12]]},
+        "created": {"date-parts": [[2025, 1, 1]], "date-time": "2025-01-01T00:00:00Z", "timestamp": 1735689600000},
+        "reference-count": random.randint(0, 80),
+        "link": [
+            {"URL": f"https://link.springer.com/content/pdf/{doi}.pdf", "content-type": "application/pdf",
+             "content-version": "vor", "intended-application": "text-mining"},
+            {"URL": f"https://link.springer.com/article/{doi}/fulltext.html", "content-type": "text/html",
+             "content-version": "vor", "intended-application": "text-mining"}
+        ],
+        "reference": [
+            {"key": f"{doi}_{k}", "doi-asserted-by": "crossref", "DOI": f"10.1/ref.{i}.{k}",
+             "unstructured": f"Author K. Some referenced work number {k}. Journal of Things, 2019"}
+            for k in range(random.randint(10, 60))
+        ],
+        "funder": [{"name": "National Science Foundation", "award": [f"AW-{i}"]}],
+        "license": [{"URL": "http://www.springer.com/tdm", "content-version": "tdm",
+                     "delay-in-days": 0, "start": {"date-parts": [[2025, 1, 1]]}}],
+        "assertion": [{"value": "Received", "name": "received", "label": "Received", "order": 1}],
+    }
+
+def measure(build: Callable[[], Any]) -> Tuple[Any, int]:
+    """Возвращает построенный объект и объём памяти, который он удерживает"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+def time_normalization(count: int, distinct: int = 1000) -> Tuple[float, float]:
+    """
+    Время (с) Work.from_item и normalize_item на count записях.
+    Записи берутся по кругу из distinct разобранных элементов, чтобы не держать
+    в памяти count полных ответов CrossRef.
+    """
+    items = json.loads(json.dumps([synthetic_item(i) for i in range(distinct)]))
+    pub_av = {"publisher_pdf": True, "publisher_links": [], "publisher_tier": "http"}
+    pirates = {"pirates_any": False, "pirates": {}}
+
+    start = time.perf_counter()
+    works = [Work.from_item(items[i % distinct]) for i in range(count)]
+    from_item_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for work in works:
+        normalize_item(work.doi, work, pub_av, pirates, "yes")
+    normalize_seconds = time.perf_counter() - start
+    return from_item_seconds, normalize_seconds
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Memory benchmark: raw CrossRef dicts vs Work records")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--normalize-count", type=int, default=100000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    # элементы проходят через JSON, как при разборе ответа API
+    payload = json.dumps([synthetic_item(i) for i in range(args.count)])
+
+    raw, raw_bytes = measure(lambda: {it["DOI"]: it for it in json.loads(payload)})
+    works, work_bytes = measure(lambda: {it["DOI"]: Work.from_item(it) for it in json.loads(payload)})
+
+    raw_cache = len(json.dumps(raw, ensure_ascii=False, indent=2))
+    work_cache = len(json.dumps([w.to_row() for w in works.values()], separators=(",", ":")))
+
+    print(f"DOIs: {args.count}")
+    print(f"dict-of-dicts: {raw_bytes / 2**20:8.1f} MiB in memory, {raw_cache / 2**20:8.1f} MiB cache")
+    print(f"Work records:  {work_bytes / 2**20:8.1f} MiB in memory, {work_cache / 2**20:8.1f} MiB cache")
+    print(f"ratio: {raw_bytes / max(1, work_bytes):.1f}x memory, {raw_cache / max(1, work_cache):.1f}x cache")
+
+    from_item_seconds, normalize_seconds = time_normalization(args.normalize_count)
+    per_record = (from_item_seconds + normalize_seconds) / max(1, args.normalize_count)
+    print(f"normalization of {args.normalize_count} records: Work.from_item {from_item_seconds:.2f} s, "
+          f"normalize_item {normalize_seconds:.2f} s ({per_record * 1e6:.1f} us per record)")
+
+if __name__ == "__main__":
+    main()
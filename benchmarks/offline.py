@@ -0,0 +1,425 @@
+"""
+Офлайн-бенчмарк этапов 2–4 на локальных заглушках вместо внешних сервисов:
+  - CrossRef /works с курсорной пагинацией и синтетическими записями,
+  - сайты издателей (PDF, промежуточные страницы с редиректом, JS-проверки, ошибки 503),
+  - пиратский ресурс и страница поиска в стиле ResearchGate.
+
+Для каждого масштаба запускаются stage_collect_dois, stage_process_dois и exporter.save;
+для каждого этапа выводятся DOI/с, задержки p50/p99 и пиковый RSS процесса.
+Отдельно измеряется время запуска: импорт модулей, нужных каждой команде cli.py.
+Заглушки работают в отдельном процессе, чтобы не делить GIL с измеряемым кодом.
+
+Запуск из корня проекта:
+    python -m benchmarks.offline --scales 1000,10000,100000
+    python -m benchmarks.offline --scales 1000 --json ../results/bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote_plus, urlsplit
+
+# Адреса заглушек: на Linux весь 127.0.0.0/8 ведёт на loopback, поэтому каждый
+# «издатель» получает свой хост и host_scheduler ограничивает их независимо
+CROSSREF_ADDR = "127.0.0.1"
+RESEARCHGATE_ADDR = "127.0.0.20"
+PIRATE_ADDR = "127.0.0.21"
+PUBLISHER_ADDRS = [f"127.0.0.{i}" for i in range(2, 6)]
+
+ISSN = "0000-0000"
+DOI_PREFIX = "10.5555/bench."
+PDF_BODY = b"%PDF-1.4\n" + b"0" * 2048
+HTML_BODY = b"<html><body>landing page</body></html>"
+
+# Что импортирует каждая команда cli.py до начала работы этапа
+STARTUP_IMPORTS = {
+    "cli collect": "import cli, orchestrator, crossref_client",
+    "cli check": "import cli, orchestrator, availability_checker, exporter",
+    "cli export": "import cli, orchestrator, exporter",
+    "main.py": "import main",
+}
+HEAVY_MODULES = ("playwright", "openpyxl", "tqdm", "aiohttp", "pyarrow")
+
+class StubSettings:
+    """Параметры заглушек; передаются в дочерний процесс"""
+    def __init__(self, count: int, keywords: int, latency: float, error_rate: float,
+                 interstitial_rate: float, challenge_rate: float, found_rate: float):
+        self.count = count
+        self.keywords = keywords
+        self.latency = latency
+        self.error_rate = error_rate
+        self.interstitial_rate = interstitial_rate
+        self.challenge_rate = challenge_rate
+        self.found_rate = found_rate
+
+def keyword_slice(k: int, settings: StubSettings) -> Tuple[int, int]:
+    """
+    Номера записей, которые CrossRef-заглушка отдаёт по k-му ключевому слову.
+    Соседние срезы пересекаются на 5%, чтобы этап 2 выполнял реальную дедупликацию.
+    """
+    size = settings.count // settings.keywords
+    start = k * size
+    end = settings.count if k == settings.keywords - 1 else start + size + size // 20
+    return start, min(end, settings.count)
+
+def work_item(i: int, publishers: List[str]) -> Dict[str, Any]:
+    """Синтетическая запись CrossRef с полями из crossref_client.CROSSREF_SELECT"""
+    doi = f"{DOI_PREFIX}{i}"
+    publisher = publishers[i % len(publishers)]
+    return {
+        "DOI": doi,
+        "URL": f"https://doi.org/{doi}",
+        "title": [f"Synthetic work {i} on low-rate denial of service detection"],
+        "author": [{"given": f"Given{j}", "family": f"Family{j}"} for j in range(1 + i % 5)],
+        "published": {"date-parts": [[2025, 1 + i % 12, 1 + i % 28]]},
+        "reference-count": i % 80,
+        "link": [
+            {"URL": f"{publisher}/pdf/{i}.pdf", "content-type": "application/pdf"},
+            {"URL": f"{publisher}/article/{i}", "content-type": "text/html"},
+        ],
+    }
+
+def _outcome(i: int, salt: str, rate: float) -> bool:
+    """Детерминированный выбор «исхода» для записи i, чтобы прогоны были сопоставимы"""
+    return random.Random(f"{salt}:{i}").random() < rate
+
+def _make_handler(settings: StubSettings, publishers: List[str]):
+    failed_once: set = set()
+    failed_lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes = b"", content_type: str = "text/html",
+                  headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if settings.latency:
+                time.sleep(settings.latency * random.uniform(0.5, 1.5))
+            parts = urlsplit(self.path)
+            query = parse_qs(parts.query)
+
+            if parts.path == "/works":
+                return self._works(query)
+            m = re.fullmatch(r"/pdf/(\d+)\.pdf", parts.path)
+            if m:
+                return self._pdf(int(m.group(1)))
+            if parts.path.startswith("/article/") or parts.path.startswith("/landing/"):
+                return self._send(200, HTML_BODY)
+            if parts.path == "/search/publication":
+                return self._researchgate(query.get("q", [""])[0])
+            m = re.search(r"bench\.(\d+)$", unquote_plus(parts.path))
+            if m:
+                return self._pirate(int(m.group(1)))
+            self._send(404)
+
+        def _works(self, query: Dict[str, List[str]]) -> None:
+            k = int(re.search(r"(\d+)$", query.get("query", ["0"])[0]).group(1))
+            rows = int(query.get("rows", ["100"])[0])
+            cursor = query.get("cursor", ["*"])[0]
+            start, end = keyword_slice(k, settings)
+            offset = start if cursor == "*" else int(cursor)
+            fields = query.get("select", [""])[0].split(",")
+
+            items = []
+            for i in range(offset, min(offset + rows, end)):
+                item = work_item(i, publishers)
+                items.append({f: item[f] for f in fields if f in item} if fields[0] else item)
+            message = {
+                "items": items,
+                "total-results": end - start,
+                "next-cursor": str(offset + rows) if offset + rows < end else None,
+            }
+            self._send(200, json.dumps({"message": message}).encode(), "application/json")
+
+        def _pdf(self, i: int) -> None:
+            if _outcome(i, "error", settings.error_rate):
+                # временный сбой: 503 только на первый запрос, повтор проходит
+                with failed_lock:
+                    first = i not in failed_once
+                    failed_once.add(i)
+                if first:
+                    return self._send(503)
+            if _outcome(i, "interstitial", settings.interstitial_rate):
+                # промежуточная страница: редирект на HTML, HTTP-проверка решает сама
+                return self._send(302, headers={"Location": f"/landing/{i}"})
+            if _outcome(i, "challenge", settings.challenge_rate):
+                # JS-проверка по тому же URL: однозначный ответ даёт только браузер
+                return self._send(200, HTML_BODY)
+            self._send(206, PDF_BODY, "application/pdf")
+
+        def _researchgate(self, title: str) -> None:
+            m = re.search(r"work (\d+)", title)
+            i = int(m.group(1)) if m else -1
+            doi = f"{DOI_PREFIX}{i}" if _outcome(i, "rg", settings.found_rate) else "10.0/other"
+            body = (f'<html><body><div class="nova-legacy-v-publication-item__stack">'
+                    f'{doi}</div></body></html>').encode()
+            self._send(200, body)
+
+        def _pirate(self, i: int) -> None:
+            if _outcome(i, "pirate", settings.found_rate):
+                return self._send(200, f"<html>{DOI_PREFIX}{i}</html>".encode())
+            self._send(404)
+
+    return StubHandler
+
+def _bindable(addr: str) -> bool:
+    import socket
+    try:
+        with socket.socket() as s:
+            s.bind((addr, 0))
+        return True
+    except OSError:
+        return False
+
+def serve_stubs(settings: StubSettings, ready: "multiprocessing.Queue") -> None:
+    """Запускает все заглушки и сообщает их базовые URL через очередь ready"""
+    multi_host = all(_bindable(a) for a in [RESEARCHGATE_ADDR, PIRATE_ADDR] + PUBLISHER_ADDRS)
+    addrs = {
+        "crossref": CROSSREF_ADDR,
+        "researchgate": RESEARCHGATE_ADDR if multi_host else CROSSREF_ADDR,
+        "pirate": PIRATE_ADDR if multi_host else CROSSREF_ADDR,
+    }
+    for n, addr in enumerate(PUBLISHER_ADDRS):
+        addrs[f"publisher{n}"] = addr if multi_host else CROSSREF_ADDR
+
+    servers = {name: ThreadingHTTPServer((addr, 0), BaseHTTPRequestHandler) for name, addr in addrs.items()}
+    urls = {name: f"http://{srv.server_address[0]}:{srv.server_address[1]}" for name, srv in servers.items()}
+    handler = _make_handler(settings, [urls[f"publisher{n}"] for n in range(len(PUBLISHER_ADDRS))])
+    for srv in servers.values():
+        srv.daemon_threads = True
+        srv.RequestHandlerClass = handler
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+
+    ready.put(urls)
+    threading.Event().wait()
+
+class RssSampler:
+    """Фоновый замер RSS процесса; peak — максимум с последнего reset()"""
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        # без /proc доступен только пик за всё время работы процесса
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def reset(self) -> None:
+        self.peak = self.current()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+
+@contextmanager
+def timed(owner: Any, name: str, samples: List[float]) -> Iterator[None]:
+    """Временно оборачивает owner.name, записывая длительность каждого вызова в samples"""
+    original: Callable[..., Any] = getattr(owner, name)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    setattr(owner, name, wrapper)
+    try:
+        yield
+    finally:
+        setattr(owner, name, original)
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def stage_report(name: str, count: int, wall: float, samples: List[float], peak_rss: int) -> Dict[str, Any]:
+    return {
+        "stage": name,
+        "dois": count,
+        "seconds": round(wall, 3),
+        "dois_per_sec": round(count / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+        "peak_rss_mib": round(peak_rss / 2**20, 1),
+    }
+
+def measure_startup(runs: int) -> List[Dict[str, Any]]:
+    """
+    Время импорта (медиана по runs запускам нового интерпретатора) для каждой команды
+    и список тяжёлых зависимостей, которые при этом загрузились.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report = []
+    for name, statement in STARTUP_IMPORTS.items():
+        code = (f"import sys, time, json; t = time.perf_counter(); {statement}; "
+                f"print(json.dumps([time.perf_counter() - t, "
+                f"[m for m in {HEAVY_MODULES!r} if m in sys.modules]]))")
+        timings, heavy = [], []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-c", code], cwd=root, check=True,
+                                 capture_output=True, text=True).stdout
+            seconds, heavy = json.loads(out.strip().splitlines()[-1])
+            timings.append(seconds)
+        report.append({"command": name, "import_ms": round(statistics.median(timings) * 1000, 1),
+                       "heavy_modules": heavy})
+    return report
+
+def configure_modules(urls: Dict[str, str], args: argparse.Namespace) -> None:
+    """Направляет клиентов на заглушки так же, как это делает orchestrator.process_dois"""
+    import availability_checker
+    import crossref_client
+    import host_scheduler
+    from playwright_utils import browser_pool
+
+    crossref_client.configure({"base_url": urls["crossref"] + "/works"})
+    availability_checker.configure({"researchgate_search_url": urls["researchgate"] + "/search/publication?q="})
+    host_scheduler.configure({
+        urlsplit(url).hostname: {"concurrency": args.host_concurrency, "min_interval": 0.0}
+        for name, url in urls.items() if name != "crossref"
+    })
+    browser_pool.configure({"headless": True})
+
+def run_scale(count: int, args: argparse.Namespace, sampler: RssSampler) -> List[Dict[str, Any]]:
+    import crossref_client
+    import exporter
+    import orchestrator
+    from cache_manager import DoiStore
+
+    settings = StubSettings(count, args.keywords, args.latency / 1000, args.error_rate,
+                            args.interstitial_rate, args.challenge_rate, args.found_rate)
+    ready: "multiprocessing.Queue" = multiprocessing.Queue()
+    stubs = multiprocessing.Process(target=serve_stubs, args=(settings, ready), daemon=True)
+    stubs.start()
+    report = []
+    try:
+        urls: Dict[str, str] = ready.get(timeout=30)
+        configure_modules(urls, args)
+        keywords = [f"keyword {k}" for k in range(args.keywords)]
+        pirate_urls = [urls["pirate"] + "/"]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = DoiStore(os.path.join(tmp, "dois.sqlite"))
+
+            samples: List[float] = []
+            sampler.reset()
+            start = time.perf_counter()
+            with timed(crossref_client, "safe_get", samples):
+                orchestrator.stage_collect_dois(store, [ISSN], keywords, None, None, args.rows)
+            report.append(stage_report("collect", len(store), time.perf_counter() - start,
+                                       samples, sampler.peak))
+
+            samples = []
+            sampler.reset()
+            start = time.perf_counter()
+            with timed(orchestrator, "process_single_doi_item", samples):
+                results = orchestrator.stage_process_dois(store, pirate_urls, args.researchgate)
+            report.append(stage_report("check", len(results), time.perf_counter() - start,
+                                       samples, sampler.peak))
+
+            samples = []
+            sampler.reset()
+            start = time.perf_counter()
+            with timed(exporter.StreamingExporter, "write", samples):
+                exporter.save(results, os.path.join(tmp, "results.json"),
+                              os.path.join(tmp, "results.xlsx"))
+            report.append(stage_report("export", len(results), time.perf_counter() - start,
+                                       samples, sampler.peak))
+            store.close()
+    finally:
+        stubs.terminate()
+        stubs.join()
+
+    for row in report:
+        row["scale"] = count
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark of stages 2-4 against local stub servers")
+    parser.add_argument("--scales", default="1000,10000,100000",
+                        help="comma-separated numbers of DOIs")
+    parser.add_argument("--keywords", type=int, default=4, help="keyword queries per run")
+    parser.add_argument("--rows", type=int, default=1000, help="CrossRef page size")
+    parser.add_argument("--latency", type=float, default=5.0, help="mean stub response latency, ms")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="share of PDF links answering 503 to the first request")
+    parser.add_argument("--interstitial-rate", type=float, default=0.2,
+                        help="share of PDF links redirecting to an HTML page")
+    parser.add_argument("--challenge-rate", type=float, default=0.0,
+                        help="share of PDF links needing the browser (requires Playwright browsers)")
+    parser.add_argument("--found-rate", type=float, default=0.3,
+                        help="share of DOIs found on pirate and ResearchGate stubs")
+    parser.add_argument("--host-concurrency", type=int, default=8,
+                        help="host_limits concurrency for every stub host")
+    parser.add_argument("--researchgate", action="store_true",
+                        help="run ResearchGate checks (requires Playwright browsers)")
+    parser.add_argument("--startup-runs", type=int, default=5,
+                        help="interpreter launches per command for the startup measurement (0 to skip)")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    startup: List[Dict[str, Any]] = measure_startup(args.startup_runs) if args.startup_runs else []
+    report: List[Dict[str, Any]] = []
+    with RssSampler() as sampler:
+        for count in (int(s) for s in args.scales.split(",")):
+            report.extend(run_scale(count, args, sampler))
+
+    print(f"\n{'scale':>8} {'stage':<8} {'DOIs':>8} {'sec':>9} {'DOI/s':>9} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'RSS MiB':>8}")
+    for r in report:
+        print(f"{r['scale']:>8} {r['stage']:<8} {r['dois']:>8} {r['seconds']:>9} {r['dois_per_sec']:>9} "
+              f"{r['p50_ms']:>9} {r['p99_ms']:>9} {r['peak_rss_mib']:>8}")
+
+    if startup:
+        print(f"\n{'startup':<12} {'import ms':>10}  heavy modules loaded")
+        for r in startup:
+            print(f"{r['command']:<12} {r['import_ms']:>10}  {', '.join(r['heavy_modules']) or '-'}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"stages": report, "startup": startup}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
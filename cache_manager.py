@@ -1,7 +1,12 @@
 import json
 import os
-from typing import Dict, Any
+import sqlite3
+import threading
+import time
+from datetime import date
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 from decorators import stage_logger
+from work import Work
 
 @stage_logger("Checking cached DOIs")
 def load_doi_cache(cache_path: str) -> Dict[str, Any]:
@@ -20,12 +25,299 @@ def load_doi_cache(cache_path: str) -> Dict[str, Any]:
         print(f"Warning: Cache file {cache_path} is corrupted. Starting fresh. Error: {e}")
         return {}
 
-def save_doi_cache(doi_data: Dict[str, Any], cache_path: str) -> None:
-    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+class DoiStore:
+    """
+    Хранилище DOI в SQLite с индексом по нормализованному DOI.
+    Записи Work хранятся в компактном виде (Work.to_row).
+    Помимо самих записей CrossRef хранит журнал уже выполненных запросов
+    (ISSN, ключевое слово, интервал дат), чтобы повторный запуск догружал только недостающее,
+    и источники каждого DOI — запросы, которые его вернули (см. scoped).
+    Записи читаются из файла по мере обхода, без загрузки всего кэша в память.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS works (
+            doi TEXT PRIMARY KEY,
+            reference_count INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS queries (
+            issn TEXT NOT NULL,
+            keyword TEXT NOT NULL,
+            date_from TEXT NOT NULL,
+            date_to TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (issn, keyword, date_from, date_to)
+        );
+        CREATE TABLE IF NOT EXISTS sources (
+            doi TEXT NOT NULL,
+            issn TEXT NOT NULL,
+            keyword TEXT NOT NULL,
+            date_from TEXT NOT NULL,
+            date_to TEXT NOT NULL,
+            PRIMARY KEY (doi, issn, keyword, date_from, date_to)
+        );
+        CREATE INDEX IF NOT EXISTS sources_query ON sources(issn, keyword);
+    """
 
-    try:
-        with open(cache_path, "w", encoding="utf-8") as f:
-            json.dump(doi_data, f, ensure_ascii=False, indent=2)
-        print(f"Saved cached DOIs to {cache_path}")
-    except IOError as e:
-        print(f"Error: Could not save cache to {cache_path}. Error: {e}")
\ No newline at end of file
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        has_sources = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sources'"
+        ).fetchone()
+        self._conn.executescript(self.SCHEMA)
+        if not has_sources:
+            # в хранилище без источников журнал запросов сбрасывается, чтобы следующий
+            # сбор выполнил их заново и записал, откуда взялся каждый DOI
+            with self._conn:
+                self._conn.execute("DELETE FROM queries")
+
+    def upsert(self, items: Iterable[Work]) -> int:
+        """
+        Добавляет или обновляет записи по нормализованному DOI.
+        Существующая запись заменяется, только если у новой больше цитирований.
+        Возвращает число добавленных или обновлённых записей.
+        """
+        rows = [
+            (it.doi.strip().lower(), it.reference_count,
+             json.dumps(it.to_row(), ensure_ascii=False, separators=(",", ":")))
+            for it in items if it.doi
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                """
+                INSERT INTO works (doi, reference_count, data) VALUES (?, ?, ?)
+                ON CONFLICT(doi) DO UPDATE SET
+                    reference_count = excluded.reference_count,
+                    data = excluded.data
+                WHERE excluded.reference_count > works.reference_count
+                """,
+                rows
+            )
+            return self._conn.total_changes - before
+
+    def update_changed(self, items: Iterable[Work]) -> List[Tuple[Work, Work]]:
+        """
+        Перезаписывает записи, которые уже есть в хранилище и отличаются от новых
+        (в отличие от upsert — независимо от числа цитирований).
+        Возвращает пары (старая запись, новая запись) для изменённых DOI.
+        """
+        fresh: Dict[str, Work] = {it.doi.strip().lower(): it for it in items if it.doi}
+        if not fresh:
+            return []
+        with self._lock, self._conn:
+            placeholders = ",".join("?" * len(fresh))
+            rows = self._conn.execute(
+                f"SELECT doi, data FROM works WHERE doi IN ({placeholders})", list(fresh)
+            ).fetchall()
+            changed: List[Tuple[Work, Work]] = []
+            for doi, data in rows:
+                old = Work.from_row(json.loads(data))
+                if old != fresh[doi]:
+                    changed.append((old, fresh[doi]))
+            self._conn.executemany(
+                "UPDATE works SET reference_count = ?, data = ? WHERE doi = ?",
+                [(new.reference_count, json.dumps(new.to_row(), ensure_ascii=False, separators=(",", ":")),
+                  new.doi.strip().lower()) for _, new in changed]
+            )
+        return changed
+
+    def add_sources(self, issn: str, keyword: str,
+                    date_from: Optional[str], date_to: Optional[str], items: Iterable[Work]) -> None:
+        """Запоминает, что записи items найдены запросом (issn, keyword, интервал)"""
+        rows = [(it.doi.strip().lower(), issn, keyword, date_from or "", date_to or "")
+                for it in items if it.doi]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO sources (doi, issn, keyword, date_from, date_to) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def scoped(self, issns: List[str], keywords: List[str],
+               date_from: Optional[str], date_to: Optional[str]) -> "DoiScope":
+        """Записи, найденные запросами по данным ISSN и ключевым словам внутри интервала дат"""
+        return DoiScope(self, issns, keywords, date_from, date_to)
+
+    def is_fetched(self, issn: str, keyword: str,
+                   date_from: Optional[str], date_to: Optional[str]) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM queries WHERE issn = ? AND keyword = ? AND date_from = ? AND date_to = ?",
+                (issn, keyword, date_from or "", date_to or "")
+            ).fetchone()
+        return row is not None
+
+    def mark_fetched(self, issn: str, keyword: str,
+                     date_from: Optional[str], date_to: Optional[str]) -> None:
+        """
+        Отмечает запрос как выполненный.
+        Интервалы, которые ещё не закончились (или не ограничены сверху), не отмечаются:
+        в них могут появиться новые публикации.
+        """
+        if not date_to or date_to.split("T")[0] >= date.today().isoformat():
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries (issn, keyword, date_from, date_to, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (issn, keyword, date_from or "", date_to, time.time())
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM works").fetchone()[0]
+
+    def __contains__(self, doi: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM works WHERE doi = ?", (doi,)).fetchone()
+        return row is not None
+
+    def __getitem__(self, doi: str) -> Work:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM works WHERE doi = ?", (doi,)).fetchone()
+        if row is None:
+            raise KeyError(doi)
+        return Work.from_row(json.loads(row[0]))
+
+    def items(self, batch_size: int = 500) -> Iterator[Tuple[str, Work]]:
+        """Лениво обходит записи пачками по batch_size"""
+        last_doi = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT doi, data FROM works WHERE doi > ? ORDER BY doi LIMIT ?",
+                    (last_doi, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for doi, data in rows:
+                yield doi, Work.from_row(json.loads(data))
+            last_doi = rows[-1][0]
+
+    def import_json_cache(self, cache_path: str) -> int:
+        """Переносит записи из старого JSON-кэша (load_doi_cache) в хранилище"""
+        doi_data: Dict[str, Any] = load_doi_cache(cache_path)
+        return self.upsert(Work.from_item(it) for it in doi_data.values())
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class DoiScope:
+    """
+    Часть DoiStore, относящаяся к текущей конфигурации: DOI, у которых есть источник —
+    запрос по одному из issns и keywords с интервалом внутри date_from..date_to.
+    DOI, найденные только запросами вне этих границ (после сужения интервала, удаления
+    ключевого слова или ISSN), в этап 3 и выгрузку не попадают.
+    Поддерживает те же операции чтения, что и DoiStore (len, in, [], items).
+    """
+    def __init__(self, store: DoiStore, issns: List[str], keywords: List[str],
+                 date_from: Optional[str], date_to: Optional[str]):
+        self.store = store
+        conditions = [
+            f"issn IN ({','.join('?' * len(issns))})",
+            f"keyword IN ({','.join('?' * len(keywords))})"
+        ]
+        params: List[Any] = list(issns) + list(keywords)
+        # открытая граница конфигурации включает любые интервалы, закрытая — только вложенные
+        if date_from:
+            conditions.append("date_from != '' AND substr(date_from, 1, 10) >= ?")
+            params.append(date_from.split("T")[0])
+        if date_to:
+            conditions.append("date_to != '' AND substr(date_to, 1, 10) <= ?")
+            params.append(date_to.split("T")[0])
+        self._filter = "doi IN (SELECT doi FROM sources WHERE " + " AND ".join(conditions) + ")"
+        self._params = params
+
+    def __len__(self) -> int:
+        with self.store._lock:
+            return self.store._conn.execute(
+                f"SELECT COUNT(*) FROM works WHERE {self._filter}", self._params
+            ).fetchone()[0]
+
+    def __contains__(self, doi: str) -> bool:
+        with self.store._lock:
+            row = self.store._conn.execute(
+                f"SELECT 1 FROM works WHERE doi = ? AND {self._filter}", [doi] + self._params
+            ).fetchone()
+        return row is not None
+
+    def __getitem__(self, doi: str) -> Work:
+        if doi not in self:
+            raise KeyError(doi)
+        return self.store[doi]
+
+    def items(self, batch_size: int = 500) -> Iterator[Tuple[str, Work]]:
+        """Лениво обходит записи пачками по batch_size"""
+        last_doi = ""
+        while True:
+            with self.store._lock:
+                rows = self.store._conn.execute(
+                    f"SELECT doi, data FROM works WHERE doi > ? AND {self._filter} ORDER BY doi LIMIT ?",
+                    [last_doi] + self._params + [batch_size]
+                ).fetchall()
+            if not rows:
+                return
+            for doi, data in rows:
+                yield doi, Work.from_row(json.loads(data))
+            last_doi = rows[-1][0]
+
+class CheckResultStore:
+    """
+    Кэш результатов проверок этапа 3 (publisher, pirates, researchgate) в SQLite.
+    Каждый результат сохраняется сразу после проверки вместе со временем,
+    поэтому прерванный запуск можно продолжить, а свежие результаты не проверять повторно.
+    Срок годности задаётся в часах отдельно для каждого типа проверки.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS checks (
+            doi TEXT NOT NULL,
+            check_type TEXT NOT NULL,
+            value TEXT NOT NULL,
+            checked_at REAL NOT NULL,
+            PRIMARY KEY (doi, check_type)
+        );
+    """
+
+    def __init__(self, path: str, ttl_hours: Optional[Dict[str, float]] = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_hours: Dict[str, float] = ttl_hours or {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def get_fresh(self, doi: str, check_type: str) -> Optional[Any]:
+        """Возвращает сохранённый результат, если он не старше TTL данного типа проверки"""
+        ttl: float = self.ttl_hours.get(check_type, 0) or 0
+        if ttl <= 0:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM checks WHERE doi = ? AND check_type = ? AND checked_at >= ?",
+                (doi, check_type, time.time() - ttl * 3600)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_latest(self, doi: str, check_type: str) -> Optional[Any]:
+        """Возвращает последний сохранённый результат без учёта TTL (для выгрузки)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM checks WHERE doi = ? AND check_type = ?", (doi, check_type)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, doi: str, check_type: str, value: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checks (doi, check_type, value, checked_at) VALUES (?, ?, ?, ?)",
+                (doi, check_type, json.dumps(value, ensure_ascii=False), time.time())
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,111 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Any, TypeVar
+
+import metrics
+from host_scheduler import host_of
+
+T = TypeVar("T")
+
+# Значения по умолчанию; переопределяются секцией "circuit_breaker" в config.json
+FAILURE_THRESHOLD = 5     # подряд идущих сбоев до размыкания
+COOLDOWN = 300.0          # сколько секунд хост считается недоступным
+RETRIES = 3               # попыток на один запрос
+RETRY_DELAY = 1.0         # базовая задержка между попытками, с
+
+class CircuitOpenError(Exception):
+    """Хост временно отключён: после серии сбоев запросы к нему не выполняются"""
+    def __init__(self, host: str):
+        super().__init__(f"circuit open for {host}")
+        self.host = host
+
+class _HostCircuit:
+    def __init__(self):
+        self.failures = 0
+        self.open_until = 0.0
+        # полуоткрытое состояние: время начала пробного запроса (0 — пробы нет)
+        self.trial_started = 0.0
+
+_lock = threading.Lock()
+_circuits: Dict[str, _HostCircuit] = {}
+
+def configure(cfg: Dict[str, Any]) -> None:
+    global FAILURE_THRESHOLD, COOLDOWN, RETRIES, RETRY_DELAY
+    FAILURE_THRESHOLD = cfg.get("failure_threshold", FAILURE_THRESHOLD)
+    COOLDOWN = cfg.get("cooldown", COOLDOWN)
+    RETRIES = cfg.get("retries", RETRIES)
+    RETRY_DELAY = cfg.get("retry_delay", RETRY_DELAY)
+
+def _circuit(host: str) -> _HostCircuit:
+    circuit = _circuits.get(host)
+    if circuit is None:
+        circuit = _circuits[host] = _HostCircuit()
+    return circuit
+
+def allow(host: str) -> bool:
+    """
+    Можно ли обращаться к хосту. После окончания паузы пропускается ровно один
+    пробный запрос; остальные получают отказ, пока проба не завершится.
+    Успех пробы замыкает цепь, сбой — снова размыкает её на COOLDOWN.
+    Проба, не завершившаяся за COOLDOWN (например, поток прервался), заменяется новой.
+    """
+    with _lock:
+        circuit = _circuit(host)
+        if circuit.open_until == 0.0:
+            return True
+        now = time.monotonic()
+        if now < circuit.open_until:
+            return False
+        if circuit.trial_started and now - circuit.trial_started < COOLDOWN:
+            return False
+        circuit.trial_started = now
+        return True
+
+def record_success(host: str) -> None:
+    with _lock:
+        circuit = _circuit(host)
+        circuit.failures = 0
+        circuit.open_until = 0.0
+        circuit.trial_started = 0.0
+
+def record_failure(host: str) -> None:
+    with _lock:
+        circuit = _circuit(host)
+        circuit.failures += 1
+        if circuit.trial_started or (circuit.failures >= FAILURE_THRESHOLD and circuit.open_until == 0.0):
+            circuit.open_until = time.monotonic() + COOLDOWN
+            circuit.trial_started = 0.0
+            metrics.inc("circuit_breaker.opened")
+            print(f"Host {host} is unavailable, skipping it for {COOLDOWN:.0f} s")
+
+def call(url: str, request: Callable[[], T],
+         is_failure: Callable[[T], bool] = lambda result: False) -> T:
+    """
+    Выполняет один запрос к хосту url с повторными попытками.
+    Повторяется только этот запрос, а не вся проверка. Исключение или результат,
+    для которого is_failure возвращает True, считаются сбоем хоста.
+    Если цепь хоста разомкнута, сразу выбрасывает CircuitOpenError.
+    """
+    host = host_of(url)
+    for attempt in range(RETRIES):
+        if not allow(host):
+            metrics.inc("circuit_breaker.rejected")
+            raise CircuitOpenError(host)
+        try:
+            result: T = request()
+        except Exception as e:
+            metrics.inc(f"request_errors.{type(e).__name__}")
+            record_failure(host)
+            if attempt == RETRIES - 1:
+                raise
+        else:
+            if not is_failure(result):
+                record_success(host)
+                return result
+            record_failure(host)
+            if attempt == RETRIES - 1:
+                return result
+        metrics.inc("retries.requests")
+        time.sleep(RETRY_DELAY * (attempt + 1) * random.uniform(0.8, 1.2))
+    raise RuntimeError("unreachable")
@@ -0,0 +1,127 @@
+"""
+Командная строка парсера: этапы можно запускать по отдельности.
+
+    python cli.py run       # все этапы, как main.py
+    python cli.py collect   # этап 2: сбор DOI в хранилище
+    python cli.py refresh   # обновление метаданных уже сохранённых DOI пачками по doi:
+    python cli.py check     # этап 3: проверки DOI из хранилища (результаты — в кэш проверок и JSON Lines)
+    python cli.py export    # этап 4: выгрузка результатов из хранилищ, без обращения к сети
+    python cli.py worker    # воркер общей очереди этапа 3 (см. work_queue), в том числе на другой машине
+                            # (файл очереди — на общем диске с поддержкой блокировок файлов)
+
+Тяжёлые зависимости импортируются внутри команд и только тогда, когда они нужны:
+openpyxl — при записи Excel, Playwright — при первом запуске браузера, tqdm — этапам 2 и 3.
+--no-prompt отключает вопрос об открытии папки для запуска без участия пользователя.
+"""
+import argparse
+from typing import Dict, Any, List, Optional
+
+import config
+import metrics
+
+def _finish_run(cfg: Dict[str, Any]) -> None:
+    import http_client
+
+    http_client.report_stats()
+    metrics.print_summary()
+    metrics.save(cfg.get("metrics", {}))
+
+def cmd_run(cfg_path: str, prompt: bool) -> None:
+    from main import main
+
+    main(cfg_path, prompt)
+
+def cmd_collect(cfg_path: str, prompt: bool) -> None:
+    from orchestrator import collect_dois, configure_clients, open_doi_store
+
+    cfg: Dict[str, Any] = config.load_config(cfg_path)
+    configure_clients(cfg)
+    store = open_doi_store(cfg)
+    try:
+        collect_dois(cfg, store)
+    finally:
+        store.close()
+    _finish_run(cfg)
+
+def cmd_refresh(cfg_path: str, prompt: bool) -> None:
+    from orchestrator import configure_clients, open_doi_store, stage_refresh_dois
+
+    cfg: Dict[str, Any] = config.load_config(cfg_path)
+    configure_clients(cfg)
+    store = open_doi_store(cfg)
+    try:
+        stage_refresh_dois(store, cfg.get("refresh_batch_size", 100))
+    finally:
+        store.close()
+    _finish_run(cfg)
+
+def cmd_check(cfg_path: str, prompt: bool) -> None:
+    from exporter import StreamingExporter
+    from orchestrator import check_dois, configure_clients, doi_scope, open_doi_store, open_result_store
+
+    cfg: Dict[str, Any] = config.load_config(cfg_path)
+    configure_clients(cfg)
+    store = open_doi_store(cfg)
+    result_store = open_result_store(cfg)
+    # только JSON Lines: полная выгрузка — отдельной командой export
+    writer = StreamingExporter(out_jsonl=cfg.get("output", {}).get("jsonl"))
+    try:
+        scope = doi_scope(cfg, store)
+        print("DOIs to check:", len(scope))
+        check_dois(cfg, scope, result_store, sink=writer.write)
+    finally:
+        writer.close()
+        result_store.close()
+        store.close()
+    print(f"Checked {writer.count} DOIs")
+    _finish_run(cfg)
+
+def cmd_export(cfg_path: str, prompt: bool) -> None:
+    from orchestrator import doi_scope, open_doi_store, open_result_store, stored_results
+
+    cfg: Dict[str, Any] = config.load_config(cfg_path)
+    store = open_doi_store(cfg)
+    result_store = open_result_store(cfg)
+    writer = config.open_results_writer(cfg)
+    try:
+        for row in stored_results(cfg, doi_scope(cfg, store), result_store):
+            writer.write(row)
+    except BaseException:
+        writer.close()
+        raise
+    finally:
+        result_store.close()
+        store.close()
+    config.finalize_results(writer, cfg, prompt)
+
+def cmd_worker(cfg_path: str, prompt: bool) -> None:
+    from work_queue import run_worker
+
+    cfg: Dict[str, Any] = config.load_config(cfg_path)
+    run_worker(cfg)
+    _finish_run(cfg)
+
+COMMANDS = {
+    "run": (cmd_run, "collect, check and export in one run (same as main.py)"),
+    "collect": (cmd_collect, "collect DOIs from CrossRef into the DOI store"),
+    "refresh": (cmd_refresh, "re-fetch metadata of stored DOIs in batched doi: filter queries"),
+    "check": (cmd_check, "check availability of DOIs already in the store"),
+    "export": (cmd_export, "export stored DOIs and cached check results without network access"),
+    "worker": (cmd_worker, "process DOIs from the shared work queue until it is empty"),
+}
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Scientific articles parser")
+    parser.add_argument("--config", default="config.json", help="path to config.json")
+    parser.add_argument("--no-prompt", action="store_true",
+                        help="do not ask to open the results folder (for unattended runs)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        commands.add_parser(name, help=help_text)
+
+    args = parser.parse_args(argv)
+    handler = COMMANDS[args.command][0]
+    handler(args.config, not args.no_prompt)
+
+if __name__ == "__main__":
+    main()
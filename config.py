@@ -2,7 +2,6 @@ import json
 import os
 from typing import Dict, Any, List
 from decorators import stage_logger
-from utils import open_folder_prompt
 
 @stage_logger("Stage 1: Loading configuration")
 def load_config(config_path: str = "config.json") -> Dict[str, Any]:
@@ -21,15 +20,40 @@ def get_concurrency_settings() -> int:
     cpu_count: int = os.cpu_count() or 4
     return min(12, cpu_count * 3)
 
+def open_results_writer(cfg: Dict[str, Any]):
+    """Открывает потоковую запись результатов во все форматы из секции output"""
+    from exporter import StreamingExporter
+    output: Dict[str, Any] = cfg.get("output", {})
+    return StreamingExporter(output.get("json", "output.json"),
+                             output.get("excel", "output.xlsx"),
+                             output.get("jsonl"),
+                             output.get("parquet"),
+                             output.get("feather"))
+
 @stage_logger("Stage 4: Saving results")
-def save_results(results: List[Dict[str, Any]], cfg: Dict[str, Any]) -> None:
+def finalize_results(writer, cfg: Dict[str, Any], prompt: bool = True) -> None:
+    """
+    Завершает потоковую запись и предлагает открыть папку с результатами
+    (prompt=False — без вопроса, для запуска без участия пользователя)
+    """
+    writer.close()
+    print(f"Saved {writer.count} results")
+    if prompt:
+        from utils import open_folder_prompt
+        open_folder_prompt(cfg)
+
+@stage_logger("Stage 4: Saving results")
+def save_results(results: List[Dict[str, Any]], cfg: Dict[str, Any], prompt: bool = True) -> None:
     from exporter import save
+    from utils import open_folder_prompt
     outjson: str = cfg.get("output", {}).get("json", "output.json")
     outexcel: str = cfg.get("output", {}).get("excel", "output.xlsx")
 
     try:
-        save(results, outjson, outexcel)
-        open_folder_prompt(cfg)
+        save(results, outjson, outexcel,
+             cfg.get("output", {}).get("parquet"), cfg.get("output", {}).get("feather"))
+        if prompt:
+            open_folder_prompt(cfg)
     except Exception as e:
         print(f"Error saving results: {e}")
         raise
@@ -1,36 +1,110 @@
+import json
 import requests
 import time
-from typing import Dict, Any, List, Optional
+import http_client
+import metrics
+import response_cache
+from datetime import date, timedelta
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from work import Work
 
 CROSSREF_BASE = "https://api.crossref.org/works"
-REQUEST_TIMEOUT = 3
-MAX_RETRIES = 3
+MAX_RETRIES = 5
 RETRY_DELAY = 1.0
-USER_AGENT = "CyberParser/1.0 (mailto:your_email@example.com)"
+# Ответы, после которых запрос стоит повторить
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Поля, которые реально читают utils.normalize_item и publisher_availability
+CROSSREF_SELECT = ",".join([
+    "DOI", "title", "author",
+    "published", "published-online", "issued", "created",
+    "reference-count", "URL", "link"
+])
+
+class IncompleteFetchError(Exception):
+    """
+    Выгрузка прервалась на одной из страниц (ошибка запроса после всех повторов).
+    items — записи, полученные до сбоя; такой запрос нельзя считать выполненным.
+    """
+    def __init__(self, message: str, items: Optional[List[Work]] = None):
+        super().__init__(message)
+        self.items: List[Work] = items or []
+
+def configure(cfg: Dict[str, Any]) -> None:
+    """Применяет настройки из секции "crossref" конфигурации"""
+    global CROSSREF_BASE
+    CROSSREF_BASE = cfg.get("base_url", CROSSREF_BASE)
+    response_cache.configure(cfg.get("response_cache", {}))
 
 def safe_get(url: str, params: Optional[Dict[str,Any]] = None,
-             headers: Optional[Dict[str, str]] = None) -> Optional[requests.Response]:
+             headers: Optional[Dict[str, str]] = None,
+             use_cache: bool = True) -> Optional[requests.Response]:
     """
     Безопасный GET-запрос с повторными попытками.
     Используется для защиты от временных сбоев сети или API.
+    Частота запросов ограничивается rate_limiter (через http_client);
+    ответы 429/5xx повторяются, Retry-After соблюдается ограничителем хоста.
+    Если включён response_cache, свежий ответ берётся с диска без запроса,
+    а устаревший подтверждается условным запросом (ответ 304 не передаёт тело заново).
+    Запросы с курсором отдельно не кэшируются: цепочки страниц кэширует fetch_pages.
+    use_cache=False — запрос всегда идёт на сервер, ответ не сохраняется.
     """
+    cache: Optional[response_cache.ResponseCache] = response_cache.get_cache()
+    if not use_cache or (params and "cursor" in params):
+        cache = None
+    cached: Optional[response_cache.CachedResponse] = None
+    if cache is not None:
+        key: str = cache.key_for(url, params)
+        cached, fresh = cache.get(key)
+        if cached is not None and fresh:
+            metrics.inc("response_cache.hit")
+            return cached.to_response(url)
+        if cached is not None:
+            headers = {**(headers or {}), **cached.validators()}
+
+    r: Optional[requests.Response] = _get_with_retries(url, params, headers)
+    if cache is None or r is None:
+        return r
+    if r.status_code == 304 and cached is not None:
+        cache.touch(key)
+        metrics.inc("response_cache.revalidated")
+        return cached.to_response(url)
+    metrics.inc("response_cache.miss")
+    if r.status_code == 200:
+        cache.put(key, r)
+    return r
+
+def _get_with_retries(url: str, params: Optional[Dict[str,Any]],
+                      headers: Optional[Dict[str, str]]) -> Optional[requests.Response]:
     for attempt in range(MAX_RETRIES):
         try:
-            r: requests.Response = requests.get(url, params=params, headers=headers or {}, timeout=REQUEST_TIMEOUT)
-            return r
+            r: requests.Response = http_client.get(url, params=params, headers=headers or {},
+                                                   timeout=http_client.timeout("crossref"))
         except (requests.RequestException, ConnectionError, TimeoutError):
-            time.sleep(RETRY_DELAY)
+            metrics.inc("retries.crossref")
+            time.sleep(RETRY_DELAY * (attempt + 1))
+            continue
+
+        if r.status_code in RETRY_STATUSES and attempt < MAX_RETRIES - 1:
+            metrics.inc("retries.crossref")
+            if "Retry-After" not in r.headers:
+                time.sleep(RETRY_DELAY * (attempt + 1))
+            continue
+        return r
     return None
 
-def build_params(issn: Optional[str], query: str,
+def build_params(issn: Optional[str], query: Optional[str],
                  date_from: Optional[str], date_to: Optional[str],
-                 rows: int = 100, offset: int = 0) -> Dict[str, Any]:
+                 rows: int = 100, offset: int = 0,
+                 cursor: Optional[str] = None,
+                 select: Optional[str] = None) -> Dict[str, Any]:
     """
     Формирует словарь параметров для запроса в CrossRef API.
     Поддерживает:
       - фильтрацию по ISSN
       - ограничение по датам публикации
-      - пагинацию (rows, offset)
+      - пагинацию (rows, offset) или глубокую пагинацию курсором (cursor)
+      - проекцию полей ответа (select)
     """
     filters = []
     if issn:
@@ -43,72 +117,151 @@ def build_params(issn: Optional[str], query: str,
         "filter": ",".join(filters) if filters else None,
         "query": query,
         "rows": rows,
-        "offset": offset
+        # курсор и offset взаимоисключающие
+        "offset": offset if cursor is None else None,
+        "cursor": cursor,
+        "select": select
     }
     # убираем None, чтобы не отправлять пустые параметры
     return {k:v for k,v in params.items() if v is not None}
 
-def fetch_for_keyword(issn: str, keyword: str,
-                      date_from: str, date_to: str,
-                      rows: int = 100) -> List[Dict[str, Any]]:
+def fetch_pages(issn: str, keyword: Optional[str],
+                date_from: Optional[str], date_to: Optional[str],
+                rows: int = 100,
+                select: Optional[str] = CROSSREF_SELECT) -> Iterator[Tuple[List[Dict[str, Any]], int]]:
     """
-    Выполняет поиск статей в CrossRef API по одному ключевому слову.
-    Возвращает список публикаций (items).
+    Постранично выдаёт «сырые» элементы ответа CrossRef вместе с размером страницы в байтах.
+    Страницы запрашиваются курсором (cursor=*), поэтому нет ограничения offset в 10 000 записей.
+    keyword=None — все публикации ISSN за интервал, без поискового запроса.
+    Если страницу получить не удалось, выбрасывается IncompleteFetchError.
+    С включённым response_cache цепочка страниц сохраняется и повторяется только целиком:
+    курсор из сохранённой страницы мог уже истечь.
     """
-    offset = 0
-    results = []
-    headers = {"User-Agent": USER_AGENT}
+    cache: Optional[response_cache.ResponseCache] = response_cache.get_cache()
+    if cache is None:
+        for items, body in _cursor_pages(issn, keyword, date_from, date_to, rows, select):
+            yield items, len(body)
+        return
+
+    key: str = cache.key_for(CROSSREF_BASE, build_params(issn, keyword, date_from, date_to,
+                                                         rows=rows, select=select)) + "#cursor-chain"
+    pages: Optional[List[bytes]] = cache.get_chain(key)
+    if pages is not None:
+        metrics.inc("response_cache.hit")
+        for body in pages:
+            yield json.loads(body).get("message", {}).get("items", []), len(body)
+        return
+
+    metrics.inc("response_cache.miss")
+    bodies: List[bytes] = []
+    for items, body in _cursor_pages(issn, keyword, date_from, date_to, rows, select):
+        bodies.append(body)
+        yield items, len(body)
+    cache.put_chain(key, bodies)
+
+def _cursor_pages(issn: str, keyword: Optional[str],
+                  date_from: Optional[str], date_to: Optional[str],
+                  rows: int, select: Optional[str]) -> Iterator[Tuple[List[Dict[str, Any]], bytes]]:
+    """Запрашивает страницы курсором; выдаёт элементы и тело ответа каждой страницы"""
+    cursor = "*"
+    fetched = 0
+    headers = http_client.CROSSREF_HEADERS
 
     while True:
-        params: Dict[str, Any] = build_params(issn, keyword, date_from, date_to, rows=rows, offset=offset)
+        params: Dict[str, Any] = build_params(issn, keyword, date_from, date_to,
+                                              rows=rows, cursor=cursor, select=select)
         r: Optional[requests.Response] = safe_get(CROSSREF_BASE, params=params, headers=headers)
         if r is None or r.status_code != 200:
-            break
+            status = r.status_code if r is not None else "no response"
+            query = f"keyword '{keyword}'" if keyword is not None else "whole window"
+            print(f"Warning: CrossRef page dropped for ISSN {issn}, {query} "
+                  f"after {fetched} items ({status})")
+            metrics.inc("crossref.incomplete_fetches")
+            raise IncompleteFetchError(f"CrossRef page dropped for ISSN {issn}, {query} ({status})")
 
         j: Dict[str, Any] = r.json()
-        items: List[Dict[str, Any]] = j.get("message", {}).get("items", [])
+        message: Dict[str, Any] = j.get("message", {})
+        items: List[Dict[str, Any]] = message.get("items", [])
         if not items:
-            break
+            return
 
-        results.extend(items)
+        fetched += len(items)
+        yield items, r.content
 
-        # Поддержка пагинации: увеличиваем offset
-        fetched = len(items)
-        offset += fetched
-
-        total: Optional[int] = j.get("message", {}).get("total-results")
+        # Поддержка пагинации: следующий курсор приходит в ответе
+        next_cursor: Optional[str] = message.get("next-cursor")
+        total: Optional[int] = message.get("total-results")
 
         # Если данных больше нет — выходим
-        if fetched < rows or (total is not None and offset >= total):
-            break
-
-        # небольшая задержка, чтобы не перегружать API
-        time.sleep(0.1)
-
-    return results
-
-def collect_unique_by_doi(issn: str, keywords: List[str],
-                          date_from: str, date_to: str,
-                          rows: int = 100) -> Dict[str, Any]:
-    """
-    Главная функция модуля. Выполняет поиск по ISSN и ключевым словам.
-    Результаты собираются в словарь по уникальным DOI.
-    Если один и тот же DOI найден несколько раз, сохраняется запись с наибольшим количеством цитирований.
-    """
-    doi_data = {}
-    for kw in keywords:
-        items: List[Dict[str, Any]] = fetch_for_keyword(issn, kw, date_from, date_to, rows=rows)
-        for it in items:
-            doi: str = it.get("DOI", "")
-            if not doi:
-                continue
-
-            doi_norm = doi.strip().lower()
-            if doi_norm not in doi_data:
-                doi_data[doi_norm] = it
-            else:
-                # если встретился тот же DOI, обновляем запись,
-                # если у новой версии больше цитирований
-                if it.get("reference-count", 0) > doi_data[doi_norm].get("reference-count", 0):
-                    doi_data[doi_norm] = it
-    return doi_data
\ No newline at end of file
+        if (not next_cursor or len(items) < rows
+                or (total is not None and fetched >= total)):
+            return
+        cursor = next_cursor
+
+def fetch_for_keyword(issn: str, keyword: str,
+                      date_from: str, date_to: str,
+                      rows: int = 100,
+                      select: Optional[str] = CROSSREF_SELECT) -> List[Work]:
+    """
+    Выполняет поиск статей в CrossRef API по одному ключевому слову.
+    Возвращает список публикаций в виде компактных записей Work.
+    При сбое на одной из страниц выбрасывает IncompleteFetchError с уже полученными записями.
+    """
+    works: List[Work] = []
+    try:
+        for items, _ in fetch_pages(issn, keyword, date_from, date_to, rows, select):
+            works.extend(Work.from_item(it) for it in items)
+    except IncompleteFetchError as e:
+        raise IncompleteFetchError(str(e), works) from None
+    return works
+
+def probe_total(issn: str, keyword: Optional[str],
+                date_from: Optional[str], date_to: Optional[str]) -> Optional[int]:
+    """
+    Дешёвый запрос с rows=0: только число найденных публикаций (total-results).
+    keyword=None — все публикации ISSN за интервал. None при ошибке запроса.
+    """
+    params: Dict[str, Any] = build_params(issn, keyword, date_from, date_to, rows=0)
+    r: Optional[requests.Response] = safe_get(CROSSREF_BASE, params=params,
+                                              headers=http_client.CROSSREF_HEADERS)
+    if r is None or r.status_code != 200:
+        return None
+    return r.json().get("message", {}).get("total-results")
+
+def fetch_by_dois(dois: List[str], select: Optional[str] = CROSSREF_SELECT) -> Optional[List[Work]]:
+    """
+    Загружает актуальные записи сразу для нескольких DOI одним запросом
+    с фильтром doi:...,doi:... Возвращает None, если запрос не удался.
+    Кэш ответов не используется: обновление должно получить текущие данные CrossRef.
+    """
+    params: Dict[str, Any] = {
+        "filter": ",".join("doi:" + doi for doi in dois),
+        "rows": len(dois),
+        "select": select
+    }
+    r: Optional[requests.Response] = safe_get(CROSSREF_BASE, params={k: v for k, v in params.items() if v},
+                                              headers=http_client.CROSSREF_HEADERS, use_cache=False)
+    if r is None or r.status_code != 200:
+        status = r.status_code if r is not None else "no response"
+        print(f"Warning: CrossRef refresh batch of {len(dois)} DOIs dropped ({status})")
+        return None
+    return [Work.from_item(it) for it in r.json().get("message", {}).get("items", [])]
+
+def month_windows(date_from: Optional[str], date_to: Optional[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Делит интервал date_from..date_to на календарные месяцы.
+    Если одна из границ не задана или не является полной датой, возвращает интервал целиком.
+    """
+    try:
+        start = date.fromisoformat(date_from.split("T")[0])
+        end = date.fromisoformat(date_to.split("T")[0])
+    except (AttributeError, ValueError):
+        return [(date_from, date_to)]
+
+    windows = []
+    while start <= end:
+        next_month = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        window_end = min(end, next_month - timedelta(days=1))
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = next_month
+    return windows
@@ -1,35 +1,36 @@
-import random
+import asyncio
 from functools import wraps
 from typing import Callable, TypeVar
 import time
 
+import metrics
+
 T = TypeVar('T')
 
+def _stage_finished(stage_name: str, start: float) -> None:
+    elapsed = time.perf_counter() - start
+    metrics.record_stage(stage_name, elapsed)
+    print(f"✓ {stage_name} completed successfully in {elapsed:.1f} s.")
+
 def stage_logger(stage_name: str):
-    """Декоратор для логирования этапов выполнения"""
+    """Декоратор для логирования этапов выполнения и учёта их длительности в metrics"""
     def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                print(f"=== {stage_name} ===")
+                start = time.perf_counter()
+                result = await func(*args, **kwargs)
+                _stage_finished(stage_name, start)
+                return result
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs) -> T:
             print(f"=== {stage_name} ===")
+            start = time.perf_counter()
             result = func(*args, **kwargs)
-            print(f"✓ {stage_name} completed successfully.")
+            _stage_finished(stage_name, start)
             return result
         return wrapper
     return decorator
-
-def retry_on_failure(max_retries=3, delay=2):
-    """Декоратор для повторных попыток вызова функции"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        print(f"Error in {func.__name__}: {e}")
-                        raise
-                    time.sleep(delay * (attempt + 1) * random.uniform(0.8, 1.2))
-            return None
-        return wrapper
-    return decorator
\ No newline at end of file
@@ -1,70 +1,224 @@
 import json
 import os.path
+import textwrap
 
-import pandas as pd
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Alignment
-from openpyxl import load_workbook
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, IO
+
+if TYPE_CHECKING:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+# Ширина столбцов (заранее подобранные значения для читаемости)
+COL_WIDTHS = {
+    "year": 6,
+    "authors": 40,
+    "title": 60,
+    "doi": 30,
+    "citations": 11,
+    "impact_factor": 15,
+    "quartile": 10,
+    "link": 50,
+    "available_on_site": 19,
+    "researchgate": 14,
+    "pirates": 9
+}
+DEFAULT_COL_WIDTH = 15
+
+# Типы столбцов Parquet/Feather; остальные столбцы — строки
+ARROW_TYPES = {
+    "year": "int64",
+    "citations": "int64"
+}
+# Сколько записей копится по столбцам перед записью очередного блока (row group)
+ARROW_BATCH_ROWS = 10000
+
+class StreamingExporter:
+    """
+    Потоковое сохранение результатов по мере их поступления:
+      - JSON-массив (out_json) дописывается по одной записи,
+      - JSON Lines (out_jsonl) сбрасывается на диск после каждой записи,
+      - Excel (out_excel) пишется в write-only режиме openpyxl,
+      - Parquet (out_parquet) и Feather (out_feather) пишутся блоками по ARROW_BATCH_ROWS записей.
+
+    Ширины столбцов и стиль ячеек задаются один раз при записи заголовка,
+    поэтому повторно открывать книгу через load_workbook не нужно.
+    Для Parquet и Feather записи раскладываются по столбцам сразу при поступлении,
+    и каждый блок превращается в Arrow RecordBatch целиком, без построчного DataFrame.
+    openpyxl и pyarrow импортируются, только если включён соответствующий формат.
+    """
+    def __init__(self, out_json: Optional[str] = None, out_excel: Optional[str] = None,
+                 out_jsonl: Optional[str] = None, out_parquet: Optional[str] = None,
+                 out_feather: Optional[str] = None):
+        self.out_json = out_json
+        self.out_excel = out_excel
+        self.out_jsonl = out_jsonl
+        self.out_parquet = out_parquet
+        self.out_feather = out_feather
+        self.count = 0
+        self.closed = False
+
+        self._json: Optional[IO[str]] = self._open_text(out_json, "JSON")
+        self._jsonl: Optional[IO[str]] = self._open_text(out_jsonl, "JSON Lines")
+        if self._json:
+            self._json.write("[")
+
+        self._wb: Optional["Workbook"] = None
+        self._ws = None
+        self._columns: List[str] = []
+        if out_excel:
+            from openpyxl import Workbook
+            from openpyxl.cell import WriteOnlyCell
+            from openpyxl.styles import Alignment, Font
+
+            self._wb = Workbook(write_only=True)
+            self._ws = self._wb.create_sheet("Sheet1")
+            self._cell_type = WriteOnlyCell
+            self._alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+            self._bold = Font(bold=True)
+
+        # столбцы текущего блока и открытые писатели Arrow (создаются по первой записи)
+        self._arrow_paths: Dict[str, str] = {}
+        self._arrow_columns: Dict[str, List[Any]] = {}
+        self._arrow_schema = None
+        self._arrow_writers: Dict[str, Any] = {}
+        if out_parquet or out_feather:
+            try:
+                import pyarrow  # noqa: F401
+                self._arrow_paths = {kind: path for kind, path in
+                                     (("Parquet", out_parquet), ("Feather", out_feather)) if path}
+            except ImportError:
+                print("Error: Parquet/Feather output requires pyarrow (pip install pyarrow); skipped")
+
+    @staticmethod
+    def _open_text(path: Optional[str], kind: str) -> Optional[IO[str]]:
+        if not path:
+            return None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            return open(path, "w", encoding="utf-8")
+        except IOError as e:
+            print(f"Error: Could not save {kind} to {path}. Error: {e}")
+            return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _cell(self, value: Any, bold: bool = False) -> "WriteOnlyCell":
+        cell = self._cell_type(self._ws, value=value)
+        cell.alignment = self._alignment
+        if bold:
+            cell.font = self._bold
+        return cell
+
+    def _write_excel_header(self, row: Dict[str, Any]) -> None:
+        from openpyxl.utils import get_column_letter
+
+        self._columns = list(row.keys())
+        for i, col in enumerate(self._columns, start=1):
+            self._ws.column_dimensions[get_column_letter(i)].width = COL_WIDTHS.get(col, DEFAULT_COL_WIDTH)
+        self._ws.append([self._cell(col, bold=True) for col in self._columns])
+
+    def _open_arrow(self, row: Dict[str, Any]) -> None:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        self._arrow_schema = pa.schema([(col, getattr(pa, ARROW_TYPES.get(col, "string"))())
+                                        for col in row])
+        self._arrow_columns = {col: [] for col in row}
+        for kind, path in list(self._arrow_paths.items()):
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                if kind == "Parquet":
+                    writer = pyarrow.parquet.ParquetWriter(path, self._arrow_schema, compression="zstd")
+                else:
+                    # Feather v2 — это файловый формат Arrow IPC
+                    writer = pyarrow.ipc.new_file(path, self._arrow_schema,
+                                                  options=pyarrow.ipc.IpcWriteOptions(compression="zstd"))
+                self._arrow_writers[kind] = writer
+            except (IOError, pa.ArrowException) as e:
+                print(f"Error: Could not save {kind} to {path}. Error: {e}")
+                del self._arrow_paths[kind]
+        if not self._arrow_writers:
+            # ни один файл не открылся — столбцы больше не накапливаются
+            self._arrow_columns = {}
+
+    def _flush_arrow(self) -> None:
+        """Записывает накопленные столбцы одним RecordBatch во все Arrow-форматы"""
+        import pyarrow as pa
+
+        if not self._arrow_writers or not next(iter(self._arrow_columns.values()), None):
+            return
+        batch = pa.RecordBatch.from_pydict(self._arrow_columns, schema=self._arrow_schema)
+        for writer in self._arrow_writers.values():
+            writer.write_batch(batch)
+        for values in self._arrow_columns.values():
+            values.clear()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        """Дописывает одну запись во все включённые форматы"""
+        if self._json:
+            prefix = "\n" if self.count == 0 else ",\n"
+            self._json.write(prefix + textwrap.indent(json.dumps(row, ensure_ascii=False, indent=2), "  "))
+
+        if self._jsonl:
+            self._jsonl.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self._jsonl.flush()
+
+        if self._ws is not None:
+            if not self._columns:
+                self._write_excel_header(row)
+            self._ws.append([self._cell(row.get(col)) for col in self._columns])
+
+        if self._arrow_paths and self._arrow_schema is None:
+            self._open_arrow(row)
+        if self._arrow_writers:
+            for col, values in self._arrow_columns.items():
+                values.append(row.get(col))
+            if len(values) >= ARROW_BATCH_ROWS:
+                self._flush_arrow()
+
+        self.count += 1
+
+    def close(self) -> None:
+        """Завершает файлы; повторный вызов ничего не делает"""
+        if self.closed:
+            return
+        self.closed = True
+
+        if self._json:
+            self._json.write("\n]" if self.count else "]")
+            self._json.close()
+        if self._jsonl:
+            self._jsonl.close()
+        if self._wb is not None:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.out_excel)), exist_ok=True)
+                self._wb.save(self.out_excel)
+            except IOError as e:
+                print(f"Error: Could not save Excel to {self.out_excel}. Error: {e}")
+        if self._arrow_writers:
+            self._flush_arrow()
+            for writer in self._arrow_writers.values():
+                writer.close()
 
 def save(results_list: List[Dict[str, Any]],
-         out_json: Optional[str], out_excel: Optional[str]) -> None:
+         out_json: Optional[str], out_excel: Optional[str],
+         out_parquet: Optional[str] = None, out_feather: Optional[str] = None) -> None:
     """
     Сохраняет результаты работы парсера:
       - в JSON-файл (если указан out_json),
-      - в Excel (если указан out_excel).
+      - в Excel (если указан out_excel),
+      - в Parquet и Feather (если указаны out_parquet, out_feather; нужен pyarrow).
 
     В Excel добавляется оформление:
       - фиксированные ширины столбцов,
       - выравнивание текста по центру,
       - перенос по словам для длинных ячеек.
     """
-    # Сохранение в JSON
-    if out_json:
-        try:
-            os.makedirs(os.path.dirname(os.path.abspath(out_json)), exist_ok=True)
-            with open(out_json, "w", encoding="utf-8") as f:
-                json.dump(results_list, f, ensure_ascii=False, indent=2)
-        except IOError as e:
-            print(f"Error: Could not save JSON to {out_json}. Error: {e}")
-
-    # Сохранение в Excel
-    if out_excel:
-        try:
-            os.makedirs(os.path.dirname(os.path.abspath(out_excel)), exist_ok=True)
-            df = pd.DataFrame(results_list)
-            df.to_excel(out_excel, index=False)
-
-            # Ширина столбцов (заранее подобранные значения для читаемости)
-            col_widths = {
-                "year": 6,
-                "authors": 40,
-                "title": 60,
-                "doi": 30,
-                "citations": 11,
-                "impact_factor": 15,
-                "quartile": 10,
-                "link": 50,
-                "available_on_site": 19,
-                "researchgate": 14,
-                "pirates": 9
-            }
-
-            wb = load_workbook(out_excel)
-            ws = wb.active
-
-            for i, col in enumerate(ws.columns, start=1):
-                col_letter: str = get_column_letter(i)
-                header: Optional[str] = ws.cell(row=1, column=i).value
-
-                # Берём ширину из словаря или дефолтное значение
-                width: int = col_widths.get(header, 15)
-                ws.column_dimensions[col_letter].width = width
-
-                # Выравнивание и перенос слов для всех ячеек
-                for cell in col:
-                    cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-
-            wb.save(out_excel)
-        except IOError as e:
-            print(f"Error: Could not save Excel to {out_excel}. Error: {e}")
+    with StreamingExporter(out_json, out_excel, out_parquet=out_parquet, out_feather=out_feather) as writer:
+        for row in results_list:
+            writer.write(row)
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Any, Iterable, Iterator, TypeVar
+from urllib.parse import urlsplit
+
+import metrics
+
+T = TypeVar("T")
+
+# Ограничения по хостам; переопределяются секцией "host_limits" в config.json.
+# concurrency — сколько проверок одновременно обращаются к хосту,
+# min_interval — минимальная пауза (с) между началами обращений к хосту.
+HOST_LIMITS: Dict[str, Dict[str, float]] = {
+    "default": {"concurrency": 4, "min_interval": 0.0},
+    "link.springer.com": {"concurrency": 3, "min_interval": 0.2},
+    "www.researchgate.net": {"concurrency": 2, "min_interval": 1.0},
+}
+
+class _HostGate:
+    def __init__(self, concurrency: int, min_interval: float):
+        self.slots = threading.BoundedSemaphore(max(1, int(concurrency)))
+        self.min_interval = min_interval
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+
+    def wait_turn(self) -> None:
+        """Соблюдает паузу min_interval между началами обращений"""
+        if self.min_interval <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+_lock = threading.Lock()
+_gates: Dict[str, _HostGate] = {}
+
+def configure(cfg: Dict[str, Any]) -> None:
+    """Применяет ограничения из секции "host_limits" конфигурации"""
+    for host, limits in cfg.items():
+        HOST_LIMITS[host] = {**HOST_LIMITS.get(host, HOST_LIMITS["default"]), **limits}
+    with _lock:
+        _gates.clear()
+
+def host_of(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+def _gate(host: str) -> _HostGate:
+    with _lock:
+        gate = _gates.get(host)
+        if gate is None:
+            limits = HOST_LIMITS.get(host, HOST_LIMITS["default"])
+            gate = _HostGate(limits.get("concurrency", 4), limits.get("min_interval", 0.0))
+            _gates[host] = gate
+        return gate
+
+@contextmanager
+def host_slot(url: str) -> Iterator[None]:
+    """
+    Занимает одно из мест хоста url на время обращения к нему.
+    Время обращения (без ожидания места) пишется в гистограмму host_seconds.
+    """
+    host = host_of(url)
+    gate = _gate(host)
+    if not gate.slots.acquire(blocking=False):
+        metrics.inc("host_scheduler.waits")
+        gate.slots.acquire()
+    try:
+        gate.wait_turn()
+        with metrics.timer("host_seconds", host=host):
+            yield
+    finally:
+        gate.slots.release()
+
+def interleave_by_host(items: Iterable[T], key: Callable[[T], str],
+                       lookahead: int = 1000) -> Iterator[T]:
+    """
+    Переупорядочивает поток items так, чтобы соседние элементы по возможности
+    относились к разным хостам (key возвращает хост элемента).
+    Одновременно в буфере держится не более lookahead элементов.
+    """
+    buckets: "OrderedDict[str, Deque[T]]" = OrderedDict()
+    buffered = 0
+    source = iter(items)
+    exhausted = False
+
+    while True:
+        while not exhausted and buffered < lookahead:
+            try:
+                item = next(source)
+            except StopIteration:
+                exhausted = True
+                break
+            buckets.setdefault(key(item), deque()).append(item)
+            buffered += 1
+
+        if not buckets:
+            return
+
+        # один элемент от каждого хоста по кругу; обслуженный хост уходит в конец очереди
+        for host in list(buckets):
+            bucket = buckets[host]
+            yield bucket.popleft()
+            buffered -= 1
+            if bucket:
+                buckets.move_to_end(host)
+            else:
+                del buckets[host]
+            if not exhausted and buffered < lookahead // 2:
+                break
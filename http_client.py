@@ -0,0 +1,100 @@
+import threading
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import rate_limiter
+import response_cache
+from config import get_concurrency_settings
+
+# Значения по умолчанию; переопределяются секцией "http" в config.json
+TIMEOUTS: Dict[str, float] = {"crossref": 3, "availability": 3}
+HEADERS: Dict[str, str] = {"User-Agent": "Mozilla/5.0 (compatible; CyberParser/1.0)"}
+CROSSREF_HEADERS: Dict[str, str] = {"User-Agent": "CyberParser/1.0 (mailto:your_email@example.com)"}
+# Сколько разных хостов держать в пуле соединений одновременно
+POOL_HOSTS = 64
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+
+def configure(cfg: Dict[str, Any]) -> None:
+    """Применяет таймауты и заголовки из секции "http" конфигурации"""
+    TIMEOUTS.update(cfg.get("timeouts", {}))
+    HEADERS.update(cfg.get("headers", {}))
+    CROSSREF_HEADERS.update(cfg.get("crossref_headers", {}))
+
+def timeout(kind: str) -> float:
+    return TIMEOUTS.get(kind, 3)
+
+def get_session() -> requests.Session:
+    """
+    Возвращает общую для всех потоков сессию с keep-alive.
+    Пул соединений к одному хосту рассчитан на get_concurrency_settings() потоков,
+    поэтому рабочие потоки не вытесняют соединения друг друга.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS,
+                                  pool_maxsize=get_concurrency_settings())
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def get(url: str, **kwargs) -> requests.Response:
+    """
+    GET-запрос через общую сессию.
+    Перед запросом ожидает токен ограничителя хоста, после — передаёт ему
+    заголовки X-Rate-Limit-* и Retry-After.
+    Длительность запроса пишется в гистограмму http_request_seconds по хосту,
+    коды ответов и таймауты — в счётчики metrics.
+    """
+    rate_limiter.acquire(url)
+    host: str = (urlsplit(url).hostname or "").lower()
+    try:
+        with metrics.timer("http_request_seconds", host=host):
+            r: requests.Response = get_session().get(url, **kwargs)
+    except requests.Timeout:
+        metrics.inc("http.timeouts")
+        raise
+    metrics.inc(f"http.status.{r.status_code}")
+    rate_limiter.update_from_response(url, r.status_code, r.headers)
+    return r
+
+def connection_stats() -> Dict[str, int]:
+    """
+    Считает запросы и открытые соединения по пулам urllib3.
+    Разница между ними — число запросов, обслуженных уже открытым соединением.
+    """
+    with _lock:
+        session = _session
+    if session is None:
+        return {}
+
+    total_requests = total_connections = 0
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+
+    return {
+        "http.requests": total_requests,
+        "http.connections_opened": total_connections,
+        "http.connections_reused": max(0, total_requests - total_connections)
+    }
+
+def report_stats() -> None:
+    """Переносит статистику пулов соединений и кэша ответов в metrics"""
+    for name, value in connection_stats().items():
+        metrics.set_value(name, value)
+    response_cache.report_stats()
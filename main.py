@@ -1,15 +1,26 @@
 import config
+import http_client
+import metrics
 from orchestrator import process_dois
 
-def main(cfg_path="config.json"):
+def main(cfg_path="config.json", prompt=True):
     # Этап 1: Загрузка конфигурации
     cfg = config.load_config(cfg_path)
 
-    # Этапы 2 и 3: Обработка DOIs
-    results = process_dois(cfg)
+    # Этапы 2 и 3: Обработка DOIs; результаты сохраняются по мере готовности
+    writer = config.open_results_writer(cfg)
+    try:
+        process_dois(cfg, sink=writer.write)
+    except BaseException:
+        # файлы остаются корректными и содержат уже готовые результаты
+        writer.close()
+        raise
+    http_client.report_stats()
+    metrics.print_summary()
 
-    # Этап 4: Сохранение результатов
-    config.save_results(results, cfg)
+    # Этап 4: Завершение сохранения результатов
+    config.finalize_results(writer, cfg, prompt)
+    metrics.save(cfg.get("metrics", {}))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
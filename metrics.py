@@ -0,0 +1,186 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Tuple
+
+# Границы корзин гистограмм задержек, с
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                                      1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_lock = threading.Lock()
+_counters: Counter = Counter()
+_stages: Dict[str, float] = {}
+
+# Ключ гистограммы — имя и отсортированные метки, например ("check_seconds", (("check", "pirates"),))
+HistogramKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами LATENCY_BUCKETS"""
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        # последняя корзина — значения больше последней границы (+Inf)
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля: верхняя граница корзины, в которую он попадает"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+_histograms: Dict[HistogramKey, Histogram] = {}
+
+def inc(name: str, value: int = 1) -> None:
+    """Потокобезопасно увеличивает счётчик статистики запуска"""
+    with _lock:
+        _counters[name] += value
+
+def set_value(name: str, value: int) -> None:
+    """Устанавливает значение счётчика (для статистики, снимаемой целиком в конце этапа)"""
+    with _lock:
+        _counters[name] = value
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    """Добавляет длительность в гистограмму name с метками labels (например host=...)"""
+    key: HistogramKey = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+@contextmanager
+def timer(name: str, **labels: str) -> Iterator[None]:
+    """Измеряет длительность блока и записывает её в гистограмму name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Запоминает длительность этапа (повторный запуск этапа суммируется)"""
+    with _lock:
+        _stages[stage] = _stages.get(stage, 0.0) + seconds
+
+def snapshot() -> Dict[str, int]:
+    with _lock:
+        return dict(_counters)
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _stages.clear()
+        _histograms.clear()
+
+def report() -> Dict[str, Any]:
+    """Все собранные метрики в виде, пригодном для JSON"""
+    with _lock:
+        histograms: List[Dict[str, Any]] = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": h.count,
+                "sum": round(h.total, 6),
+                "max": round(h.max, 6),
+                "p50": h.quantile(0.50),
+                "p99": h.quantile(0.99),
+                "buckets": {str(le): n for le, n in zip(LATENCY_BUCKETS + ("+Inf",), h.counts)},
+            }
+            for (name, labels), h in sorted(_histograms.items())
+        ]
+        return {
+            "stages": {k: round(v, 3) for k, v in _stages.items()},
+            "counters": dict(sorted(_counters.items())),
+            "histograms": histograms,
+        }
+
+def _prometheus_name(name: str) -> str:
+    return "parser_" + "".join(c if c.isalnum() else "_" for c in name)
+
+def _prometheus_labels(labels: Dict[str, str], **extra: str) -> str:
+    pairs = {**labels, **extra}
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs.items()) + "}"
+
+def prometheus_text(data: Dict[str, Any]) -> str:
+    """Представляет report() в текстовом формате Prometheus"""
+    lines = ["# TYPE parser_stage_seconds gauge"]
+    for stage, seconds in data["stages"].items():
+        lines.append(f'parser_stage_seconds{{stage="{stage}"}} {seconds}')
+    for name, value in data["counters"].items():
+        metric = _prometheus_name(name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+
+    typed = set()
+    for h in data["histograms"]:
+        metric = _prometheus_name(h["name"])
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for le, n in h["buckets"].items():
+            cumulative += n
+            lines.append(f"{metric}_bucket{_prometheus_labels(h['labels'], le=le)} {cumulative}")
+        lines.append(f"{metric}_sum{_prometheus_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{metric}_count{_prometheus_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+def _write(path: str, text: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Metrics saved to {path}")
+    except IOError as e:
+        print(f"Error: Could not save metrics to {path}. Error: {e}")
+
+def save(cfg: Dict[str, Any]) -> None:
+    """
+    Сохраняет метрики по настройкам секции "metrics":
+      - json: путь к JSON-отчёту,
+      - prometheus: путь к файлу в текстовом формате Prometheus (необязательно).
+    """
+    data = report()
+    if cfg.get("json"):
+        _write(cfg["json"], json.dumps(data, ensure_ascii=False, indent=2))
+    if cfg.get("prometheus"):
+        _write(cfg["prometheus"], prometheus_text(data))
+
+def print_summary() -> None:
+    """Печатает накопленные счётчики и длительности этапов в конце запуска"""
+    data = report()
+    if not (data["counters"] or data["stages"]):
+        return
+    print("=== Run statistics ===")
+    for stage, seconds in data["stages"].items():
+        print(f"  {stage}: {seconds:.1f} s")
+    for name, value in data["counters"].items():
+        print(f"  {name}: {value}")
+    # самые медленные хосты — в первую очередь кандидаты на ограничения host_limits
+    hosts = sorted((h for h in data["histograms"] if "host" in h["labels"]),
+                   key=lambda h: h["sum"], reverse=True)
+    for h in hosts[:10]:
+        print(f"  {h['name']} {h['labels']['host']}: {h['count']} calls, "
+              f"{h['sum']:.1f} s total, p50 {h['p50']} s, p99 {h['p99']} s")
@@ -1,97 +1,503 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm import tqdm
-from typing import Dict, Any, List, Optional
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Dict, Any, Iterator, List, Mapping, Optional, Tuple, TypeVar
 
 from config import get_concurrency_settings
-from cache_manager import load_doi_cache, save_doi_cache
+from cache_manager import DoiScope, DoiStore, CheckResultStore
+from work import Work
 from decorators import stage_logger
+import metrics
 import os
+import threading
+
+T = TypeVar("T")
+
+# Число независимых проверок одного DOI (издатель, пиратские ресурсы, ResearchGate)
+CHECKS_PER_DOI = 3
+# Сколько DOI на один поток этапа 3 может ждать в очереди пула
+SUBMIT_WINDOW_PER_WORKER = 4
+
+# Единица сбора: (ISSN, ключевое слово, начало интервала, конец интервала)
+CollectionUnit = Tuple[str, str, Optional[str], Optional[str]]
+# Результат единицы сбора: (записи, выгружен ли запрос полностью)
+UnitResult = Tuple[List[Work], bool]
+# Задание сбора: функция без аргументов, возвращающая результаты по единицам, и единицы, которые она покрывает
+CollectionJob = Tuple[Callable[[], Dict[CollectionUnit, UnitResult]], List[CollectionUnit]]
+
+def plan_collection_units(store: DoiStore, issns: List[str], keywords: List[str],
+                          date_from: Optional[str], date_to: Optional[str],
+                          shard_by_month: bool = False) -> List[CollectionUnit]:
+    """Формирует запросы сбора, которых ещё нет в журнале хранилища"""
+    from crossref_client import month_windows
+
+    windows = month_windows(date_from, date_to) if shard_by_month else [(date_from, date_to)]
+    units = [
+        (issn, kw, w_from, w_to)
+        for issn in issns
+        for kw in keywords
+        for w_from, w_to in windows
+        if not store.is_fetched(issn, kw, w_from, w_to)
+    ]
+    print(f"Queries to fetch: {len(units)} of {len(issns) * len(keywords) * len(windows)}")
+    return units
+
+def plan_collection_jobs(store: DoiStore, issns: List[str], keywords: List[str],
+                         date_from: Optional[str], date_to: Optional[str], rows: int,
+                         shard_by_month: bool = False, plan_queries: bool = False) -> List[CollectionJob]:
+    """
+    Превращает невыполненные единицы сбора в задания. По умолчанию каждая единица —
+    отдельный поиск по ключевому слову; с plan_queries интервалы ISSN, которые дешевле
+    выгрузить целиком, обрабатываются query_planner одним заданием.
+    """
+    from functools import partial
+
+    units: List[CollectionUnit] = plan_collection_units(store, issns, keywords,
+                                                        date_from, date_to, shard_by_month)
+    if plan_queries:
+        from query_planner import plan_queries as plan
+        return plan(units, rows)
+    return [(partial(fetch_unit, unit, rows), [unit]) for unit in units]
+
+def fetch_unit(unit: CollectionUnit, rows: int = 100) -> Dict[CollectionUnit, UnitResult]:
+    """Поиск по одной единице сбора; при сбое на странице — уже полученные записи и False"""
+    from crossref_client import IncompleteFetchError, fetch_for_keyword
+
+    try:
+        return {unit: (fetch_for_keyword(*unit, rows), True)}
+    except IncompleteFetchError as e:
+        return {unit: (e.items, False)}
+
+def save_collection_result(store: DoiStore, result: Dict[CollectionUnit, UnitResult]) -> List[Work]:
+    """
+    Сохраняет результат задания сбора: записи и их источники. В журнал попадают
+    только полностью выгруженные запросы, остальные повторятся при следующем запуске.
+    Возвращает все полученные записи.
+    """
+    collected: List[Work] = []
+    for unit, (items, complete) in result.items():
+        store.upsert(items)
+        store.add_sources(*unit, items)
+        if complete:
+            store.mark_fetched(*unit)
+        collected.extend(items)
+    return collected
 
 @stage_logger("Stage 2: Collecting DOIs")
-def stage_collect_dois(issns: List[str], keywords: List[str],
+def stage_collect_dois(store: DoiStore, issns: List[str], keywords: List[str],
                        date_from: Optional[str], date_to: Optional[str],
-                       rows: int) -> Dict[str, Any]:
-    from crossref_client import collect_unique_by_doi
+                       rows: int, shard_by_month: bool = False,
+                       plan_queries: bool = False) -> DoiStore:
+    """
+    Сбор DOI, разбитый на независимые запросы (ISSN, ключевое слово, интервал дат).
+    Запросы, уже записанные в журнал хранилища, пропускаются; остальные выполняются
+    общим пулом потоков, а их результаты сразу сохраняются в store.
+    plan_queries включает планировщик запросов (см. plan_collection_jobs).
+    """
+    from tqdm import tqdm
 
-    dois_data = {}
+    jobs: List[CollectionJob] = plan_collection_jobs(store, issns, keywords, date_from, date_to,
+                                                     rows, shard_by_month, plan_queries)
     max_workers: int = get_concurrency_settings()
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(collect_unique_by_doi, issn, keywords,
-                            date_from, date_to, rows): issn
-            for issn in issns
-        }
+        futures = {executor.submit(fetch): covered for fetch, covered in jobs}
 
         with tqdm(total=len(futures), ncols=100) as pbar:
             for future in as_completed(futures):
-                doi_data: Dict[str, Any] = future.result()
-                dois_data.update(doi_data)
+                save_collection_result(store, future.result())
                 pbar.update(1)
 
-    return dois_data
+    return store
 
-@stage_logger("Stage 3: Processing DOIs")
-def stage_process_dois(dois_data: Dict[str, Any], pirate_urls: List[str],
-                       check_rg: bool) -> List[Dict[str, Any]]:
-    results = []
-    max_workers: int = get_concurrency_settings()
+@stage_logger("Refreshing cached DOIs")
+def stage_refresh_dois(store: DoiStore, batch_size: int = 100) -> Dict[str, int]:
+    """
+    Обновляет метаданные уже сохранённых DOI (число цитирований, ссылки и т. д.)
+    пачками по batch_size через фильтр doi:...,doi:... вместо повторного поиска
+    по ключевым словам. Пачки запрашиваются параллельно, частоту ограничивает rate_limiter.
+    Перезаписываются только изменившиеся записи; возвращает счётчики изменений по полям.
+    """
+    from crossref_client import fetch_by_dois
+    from tqdm import tqdm
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(process_single_doi_item, doi, raw_data,
-                            pirate_urls, check_rg): doi
-            for doi, raw_data in dois_data.items()
-        }
+    # запятая разделяет значения фильтра, поэтому такие DOI пачкой не запросить
+    dois: List[str] = [doi for doi, _ in store.items() if "," not in doi]
+    batches: List[List[str]] = [dois[i:i + batch_size] for i in range(0, len(dois), batch_size)]
+    report: Dict[str, int] = {"requested": len(dois), "requests": len(batches),
+                              "returned": 0, "changed": 0, "failed_batches": 0}
 
+    with ThreadPoolExecutor(max_workers=get_concurrency_settings()) as executor:
+        futures = [executor.submit(fetch_by_dois, batch) for batch in batches]
         with tqdm(total=len(futures), ncols=100) as pbar:
             for future in as_completed(futures):
-                result: Dict[str, Any] = future.result()
-                results.append(result)
+                items: Optional[List[Work]] = future.result()
                 pbar.update(1)
+                if items is None:
+                    report["failed_batches"] += 1
+                    continue
+                report["returned"] += len(items)
+                for old, new in store.update_changed(items):
+                    report["changed"] += 1
+                    for field in Work.__slots__:
+                        if getattr(old, field) != getattr(new, field):
+                            report[f"changed.{field}"] = report.get(f"changed.{field}", 0) + 1
+
+    for name, value in report.items():
+        metrics.inc(f"refresh.{name}", value)
+    fields = ", ".join(f"{k.split('.', 1)[1]}: {v}" for k, v in report.items() if k.startswith("changed."))
+    print(f"Refreshed {report['returned']} of {report['requested']} DOIs in {report['requests']} requests; "
+          f"{report['changed']} changed" + (f" ({fields})" if fields else ""))
+    return report
+
+@stage_logger("Stage 3: Processing DOIs")
+def stage_process_dois(dois_data: Mapping[str, Work], pirate_urls: List[str],
+                       check_rg: bool,
+                       result_store: Optional[CheckResultStore] = None,
+                       sink: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       deadline: Optional[float] = None,
+                       window: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Проверяет все DOI пулом потоков; проверки одного DOI выполняются одновременно
+    в отдельном пуле и ограничены deadline секундами (см. run_doi_checks).
+    DOI подаются вперемешку по хостам издателей, а число одновременных обращений
+    к каждому хосту ограничено host_scheduler.
+    DOI читаются из dois_data по мере освобождения места: в пуле одновременно не больше
+    window задач (по умолчанию SUBMIT_WINDOW_PER_WORKER на поток), поэтому память
+    не растёт с числом DOI.
+    Если задан sink, каждый готовый результат сразу передаётся в него и не накапливается
+    (возвращается пустой список); иначе возвращается список всех результатов.
+    """
+    from availability_checker import primary_host
+    from host_scheduler import interleave_by_host
+    from playwright_utils import browser_pool
+    from tqdm import tqdm
+    from utils import normalize_item
+
+    results = []
+    max_workers: int = get_concurrency_settings()
+    check_workers: int = CHECKS_PER_DOI * max_workers
+    window = max(max_workers, window or SUBMIT_WINDOW_PER_WORKER * max_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            ThreadPoolExecutor(max_workers=check_workers) as checks_pool:
+        checks = BoundedExecutor(checks_pool, check_workers)
+        # соседние задачи по возможности обращаются к разным издателям
+        ordered = interleave_by_host(dois_data.items(), lambda pair: primary_host(pair[1]))
+        pending: Dict[Future, Tuple[str, Work]] = {}
+        peak = 0
 
+        with tqdm(total=len(dois_data), ncols=100) as pbar:
+            while True:
+                for doi, raw_data in ordered:
+                    pending[executor.submit(process_single_doi_item, doi, raw_data,
+                                            pirate_urls, check_rg, result_store,
+                                            checks, deadline)] = (doi, raw_data)
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                peak = max(peak, len(pending))
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    doi, raw_data = pending.pop(future)
+                    try:
+                        result: Dict[str, Any] = future.result()
+                    except Exception as e:
+                        # сбойный DOI попадает в выгрузку с "unknown", как при дедлайне
+                        print(f"Error processing {doi}: {e}")
+                        metrics.inc("stage3.failed")
+                        result = normalize_item(doi, raw_data, *unknown_checks(pirate_urls, check_rg))
+                    if sink is not None:
+                        sink(result)
+                    else:
+                        results.append(result)
+                    pbar.update(1)
+
+        metrics.set_value("stage3.submit_window", window)
+        metrics.set_value("stage3.peak_pending", peak)
+
+    browser_pool.close_all()
     return results
 
-def process_single_doi_item(doi: str, raw_data: Dict[str, Any], pirate_urls: List[str],
-                            check_rg: bool) -> Dict[str, Any]:
+class BoundedExecutor(Executor):
+    """
+    Пул проверок с ограниченной очередью: одновременно отправлено не больше limit задач,
+    submit ждёт, пока освободится место. Проверки, пережившие дедлайн своего DOI,
+    занимают место, поэтому незавершённая работа не растёт с числом DOI,
+    а ожидание в очереди не съедает дедлайн следующих DOI (отсчёт начинается после submit).
+    """
+    def __init__(self, executor: Executor, limit: int):
+        self.executor = executor
+        self._slots = threading.Semaphore(limit)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        self._slots.acquire()
+        try:
+            future: Future = self.executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+def run_check(result_store: Optional[CheckResultStore], doi: str, check_type: str,
+              check: Callable[[], T], reusable: Callable[[T], bool] = lambda v: True) -> T:
+    """
+    Выполняет проверку check или берёт её свежий результат из result_store.
+    Новый результат сохраняется сразу, если reusable признаёт его окончательным.
+    """
+    if result_store is not None:
+        cached: Optional[T] = result_store.get_fresh(doi, check_type)
+        if cached is not None and reusable(cached):
+            metrics.inc(f"result_cache.hit.{check_type}")
+            return cached
+        metrics.inc(f"result_cache.miss.{check_type}")
+
+    with metrics.timer("check_seconds", check=check_type):
+        value: T = check()
+    if result_store is not None and reusable(value):
+        result_store.put(doi, check_type, value)
+    return value
+
+# Результаты проверок, не успевших завершиться до дедлайна DOI
+UNKNOWN_PUBLISHER: Dict[str, Any] = {"publisher_pdf": None, "publisher_links": [], "publisher_tier": "unknown"}
+UNKNOWN_PIRATES: Dict[str, Any] = {"pirates_any": None, "pirates": {}}
+UNKNOWN_RESEARCHGATE = "unknown"
+
+def unknown_checks(pirate_urls: List[str], check_rg: bool) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """(pub_av, pirates, rg) для DOI, проверки которого не дали результата (сбой или дедлайн)"""
+    pirates: Dict[str, Any] = dict(UNKNOWN_PIRATES) if pirate_urls else {"pirates_any": False, "pirates": {}}
+    return dict(UNKNOWN_PUBLISHER), pirates, UNKNOWN_RESEARCHGATE if check_rg else "not_checked"
+
+def log_check_failure(doi: str, name: str, error: Exception) -> None:
+    """Сбой одной проверки: она получает "unknown", остальные проверки DOI сохраняются"""
+    print(f"Error in {name} check for {doi}: {error}")
+    metrics.inc(f"check_failed.{name}")
+
+def run_doi_checks(doi: str, raw_data: Work, pirate_urls: List[str], check_rg: bool,
+                   result_store: Optional[CheckResultStore] = None,
+                   executor: Optional[Executor] = None,
+                   deadline: Optional[float] = None
+                   ) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """
+    Выполняет проверки одного DOI и возвращает (pub_av, pirates, rg) для normalize_item.
+
+    Если передан executor, проверки (издатель, пиратские ресурсы, ResearchGate) идут
+    одновременно; через deadline секунд незавершённые проверки получают значение "unknown":
+    ещё не начатые отменяются, а результат уже идущих, когда он всё же появится, попадёт
+    только в result_store.
+    Без executor проверки выполняются последовательно.
+    Проверка, завершившаяся исключением, тоже получает "unknown", не затрагивая остальные.
+    """
+    from availability_checker import publisher_availability, check_pirates, check_researchgate
+
+    checks: Dict[str, Callable[[], Any]] = {
+        "publisher": lambda: run_check(
+            result_store, doi, "publisher", lambda: publisher_availability(raw_data),
+            reusable=lambda v: v.get("publisher_pdf") is not None
+        )
+    }
+    if pirate_urls:
+        checks["pirates"] = lambda: run_check(
+            result_store, doi, "pirates", lambda: check_pirates(doi, pirate_urls),
+            reusable=lambda v: set(v.get("pirates", {})) == set(pirate_urls)
+                               and v.get("pirates_any") is not None
+        )
+    if check_rg:
+        checks["researchgate"] = lambda: run_check(
+            result_store, doi, "researchgate",
+            lambda: check_researchgate(raw_data.title, doi),
+            reusable=lambda v: v != "unknown"
+        )
+
+    values: Dict[str, Any] = {}
+    if executor is None:
+        for name, check in checks.items():
+            try:
+                values[name] = check()
+            except Exception as e:
+                log_check_failure(doi, name, e)
+    else:
+        futures: Dict[str, Future] = {name: executor.submit(check) for name, check in checks.items()}
+        wait(futures.values(), timeout=deadline)
+        # порядок разбора фиксирован, поэтому итог не зависит от порядка завершения проверок
+        for name, future in futures.items():
+            if future.done():
+                try:
+                    values[name] = future.result()
+                except Exception as e:
+                    log_check_failure(doi, name, e)
+            else:
+                metrics.inc(f"deadline_exceeded.{name}")
+                # ещё не начатая проверка больше не нужна; начатая доработает и попадёт в result_store
+                if future.cancel():
+                    metrics.inc(f"deadline_cancelled.{name}")
+
+    pub_av, pirates, rg = unknown_checks(pirate_urls, check_rg)
+    return (values.get("publisher", pub_av), values.get("pirates", pirates),
+            values.get("researchgate", rg))
+
+def process_single_doi_item(doi: str, raw_data: Work, pirate_urls: List[str],
+                            check_rg: bool,
+                            result_store: Optional[CheckResultStore] = None,
+                            executor: Optional[Executor] = None,
+                            deadline: Optional[float] = None) -> Dict[str, Any]:
     """
     Обрабатывает один DOI: проверяет доступность на сайте издателя, ResearchGate и пиратских ресурсах,
     затем нормализует данные для сохранения
 
     :param doi: DOI статьи.
-    :param raw_data: Сырые данные.
+    :param raw_data: Запись CrossRef (Work).
     :param pirate_urls: Список URL пиратских ресурсов.
     :param check_rg: Проверять ли ResearchGate.
+    :param result_store: Кэш результатов проверок (None — проверять всё заново).
+    :param executor: Пул для одновременного запуска проверок (None — последовательно).
+    :param deadline: Сколько секунд ждать проверки одного DOI (None — без ограничения).
     :return: Нормализованные данные.
     """
-    from availability_checker import publisher_availability, check_pirates, check_researchgate
     from utils import normalize_item
 
-    pub_av: Dict[str, Any] = publisher_availability(raw_data)
-    pirates: Dict[str, Any] = check_pirates(doi, pirate_urls) if pirate_urls else {"pirates_any": False, "pirates": {}}
-    rg: str = check_researchgate(raw_data.get("title", "")[0], doi) if check_rg else "not_checked"
+    pub_av, pirates, rg = run_doi_checks(doi, raw_data, pirate_urls, check_rg,
+                                         result_store, executor, deadline)
     return normalize_item(doi, raw_data, pub_av, pirates, rg)
 
-def process_dois(cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
-    cache_path: str = cfg.get("doi_cache_path", "cached_dois.json")
-    dois_data: Dict[str, Any] = load_doi_cache(cache_path)
+def open_result_store(cfg: Dict[str, Any]) -> CheckResultStore:
+    """Открывает кэш результатов проверок (по умолчанию — в файле хранилища DOI)"""
+    path: str = cfg.get("result_store_path") or cfg.get("doi_store_path", "cached_dois.sqlite")
+    return CheckResultStore(path, cfg.get("result_ttl_hours", {}))
 
-    if not dois_data:
-        dois_data = stage_collect_dois(
-            cfg.get("issns", []),
-            cfg.get("keywords", []),
-            cfg.get("date_from"),
-            cfg.get("date_to"),
-            cfg.get("crossref_rows", 100)
-        )
-        save_doi_cache(dois_data, cache_path)
+def open_doi_store(cfg: Dict[str, Any]) -> DoiStore:
+    """
+    Открывает хранилище DOI. При первом запуске переносит в него
+    записи из старого JSON-кэша (doi_cache_path), если он есть.
+    """
+    store = DoiStore(cfg.get("doi_store_path", "cached_dois.sqlite"))
+    legacy_path: Optional[str] = cfg.get("doi_cache_path")
+    if len(store) == 0 and legacy_path and os.path.exists(legacy_path):
+        imported: int = store.import_json_cache(legacy_path)
+        print(f"Imported {imported} DOIs from {legacy_path}")
+    return store
 
-    print("Total unique DOIs found:", len(dois_data))
+def doi_scope(cfg: Dict[str, Any], store: DoiStore) -> DoiScope:
+    """DOI хранилища, найденные запросами текущей конфигурации (ISSN, ключевые слова, интервал)"""
+    return store.scoped(cfg.get("issns", []), cfg.get("keywords", []),
+                        cfg.get("date_from"), cfg.get("date_to"))
 
-    results = stage_process_dois(
+def configure_clients(cfg: Dict[str, Any]) -> None:
+    """Применяет к модулям сети и проверок их секции конфигурации"""
+    from playwright_utils import browser_pool
+    import availability_checker
+    import circuit_breaker
+    import crossref_client
+    import http_client
+    import host_scheduler
+    import rate_limiter
+    http_client.configure(cfg.get("http", {}))
+    crossref_client.configure(cfg.get("crossref", {}))
+    host_scheduler.configure(cfg.get("host_limits", {}))
+    rate_limiter.configure(cfg.get("rate_limits", {}))
+    browser_pool.configure(cfg.get("browser", {}))
+    availability_checker.configure(cfg.get("availability", {}))
+    circuit_breaker.configure(cfg.get("circuit_breaker", {}))
+
+def collect_dois(cfg: Dict[str, Any], dois_data: DoiStore) -> DoiStore:
+    """Этап 2 с параметрами запроса из конфигурации"""
+    stage_collect_dois(
+        dois_data,
+        cfg.get("issns", []),
+        cfg.get("keywords", []),
+        cfg.get("date_from"),
+        cfg.get("date_to"),
+        cfg.get("crossref_rows", 100),
+        cfg.get("shard_by_month", False),
+        cfg.get("plan_queries", False)
+    )
+
+    print("Total unique DOIs found:", len(doi_scope(cfg, dois_data)))
+    return dois_data
+
+def check_dois(cfg: Dict[str, Any], dois_data: Mapping[str, Work],
+               result_store: Optional[CheckResultStore] = None,
+               sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """Этап 3 выбранным в конфигурации движком ("threads" или "async")"""
+    if cfg.get("engine", "threads") == "async":
+        import asyncio
+        from async_engine import stage_process_dois_async
+
+        async_cfg: Dict[str, Any] = cfg.get("async", {})
+        return asyncio.run(stage_process_dois_async(
+            dois_data,
+            cfg.get("pirate_urls", []),
+            cfg.get("check_researchgate", False),
+            concurrency=async_cfg.get("concurrency", 200),
+            browser_pages=async_cfg.get("browser_pages", 16),
+            headless=cfg.get("browser", {}).get("headless", False),
+            result_store=result_store,
+            sink=sink,
+            deadline=cfg.get("per_doi_deadline"),
+            window=cfg.get("submit_window")
+        ))
+
+    return stage_process_dois(
         dois_data,
         cfg.get("pirate_urls", []),
-        cfg.get("check_researchgate", False)
+        cfg.get("check_researchgate", False),
+        result_store,
+        sink,
+        cfg.get("per_doi_deadline"),
+        cfg.get("submit_window")
     )
 
-    return results
\ No newline at end of file
+def stored_results(cfg: Dict[str, Any], dois_data: Mapping[str, Work],
+                   result_store: CheckResultStore) -> Iterator[Dict[str, Any]]:
+    """
+    Собирает результаты из хранилищ без обращения к сети: последние сохранённые
+    проверки каждого DOI независимо от их срока годности. Проверки, которых
+    в кэше нет, получают значение "unknown".
+    """
+    from utils import normalize_item
+
+    pirate_urls: List[str] = cfg.get("pirate_urls", [])
+    check_rg: bool = cfg.get("check_researchgate", False)
+
+    for doi, work in dois_data.items():
+        pub_av: Dict[str, Any] = result_store.get_latest(doi, "publisher") or dict(UNKNOWN_PUBLISHER)
+        pirates: Dict[str, Any] = (result_store.get_latest(doi, "pirates") or dict(UNKNOWN_PIRATES)) \
+            if pirate_urls else {"pirates_any": False, "pirates": {}}
+        rg: str = (result_store.get_latest(doi, "researchgate") or UNKNOWN_RESEARCHGATE) \
+            if check_rg else "not_checked"
+        yield normalize_item(doi, work, pub_av, pirates, rg)
+
+def process_dois(cfg: Dict[str, Any],
+                 sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    configure_clients(cfg)
+
+    dois_data: DoiStore = open_doi_store(cfg)
+    result_store: CheckResultStore = open_result_store(cfg)
+
+    if cfg.get("pipeline", False):
+        from pipeline import stage_pipeline
+        return stage_pipeline(
+            dois_data,
+            cfg.get("issns", []),
+            cfg.get("keywords", []),
+            cfg.get("date_from"),
+            cfg.get("date_to"),
+            cfg.get("crossref_rows", 100),
+            cfg.get("shard_by_month", False),
+            cfg.get("pirate_urls", []),
+            cfg.get("check_researchgate", False),
+            result_store=result_store,
+            sink=sink,
+            queue_size=cfg.get("pipeline_queue_size"),
+            deadline=cfg.get("per_doi_deadline"),
+            plan_queries=cfg.get("plan_queries", False)
+        )
+
+    collect_dois(cfg, dois_data)
+    # этап 3 — только DOI текущих ISSN, ключевых слов и интервала дат
+    scope: DoiScope = doi_scope(cfg, dois_data)
+    if cfg.get("work_queue", {}).get("enabled", False):
+        from work_queue import stage_distributed
+        return stage_distributed(cfg, scope, sink)
+    return check_dois(cfg, scope, result_store, sink)
@@ -0,0 +1,181 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from tqdm import tqdm
+
+import metrics
+from cache_manager import DoiStore, CheckResultStore
+from config import get_concurrency_settings
+from decorators import stage_logger
+from orchestrator import (CHECKS_PER_DOI, BoundedExecutor, CollectionJob, plan_collection_jobs,
+                          run_doi_checks, save_collection_result, unknown_checks)
+from work import Work
+
+# Маркер завершения для рабочих потоков этапа 3
+_STOP = None
+
+class _PipelineState:
+    """
+    Общее состояние конвейера.
+    works — последняя (с наибольшим reference-count) версия каждого DOI, уже поставленного в очередь;
+    checks — результаты проверок; пока сбор не завершён, готовые DOI откладываются в pending,
+    потому что их запись ещё может обновиться.
+    """
+    def __init__(self, sink: Optional[Callable[[Dict[str, Any]], None]]):
+        self.sink = sink
+        self.results: List[Dict[str, Any]] = []
+        self.works: Dict[str, Work] = {}
+        self.checks: Dict[str, Tuple[Dict[str, Any], Dict[str, Any], str]] = {}
+        self.pending: List[str] = []
+        self.collecting = True
+        self.works_lock = threading.Lock()
+        self.emit_lock = threading.Lock()
+
+    def claim(self, doi: str, work: Work) -> bool:
+        """
+        Регистрирует версию DOI. Возвращает True, если DOI новый и его нужно проверить;
+        более цитируемая версия уже известного DOI только заменяет запись.
+        """
+        with self.works_lock:
+            current: Optional[Work] = self.works.get(doi)
+            if current is None:
+                self.works[doi] = work
+                return True
+            if work.reference_count > current.reference_count:
+                self.works[doi] = work
+                metrics.inc("pipeline.records_updated")
+            return False
+
+    def _emit(self, doi: str) -> None:
+        from utils import normalize_item
+
+        with self.works_lock:
+            work: Work = self.works[doi]
+        result: Dict[str, Any] = normalize_item(doi, work, *self.checks.pop(doi))
+        if self.sink is not None:
+            self.sink(result)
+        else:
+            self.results.append(result)
+
+    def finished(self, doi: str, checks: Tuple[Dict[str, Any], Dict[str, Any], str]) -> None:
+        with self.emit_lock:
+            self.checks[doi] = checks
+            if self.collecting:
+                self.pending.append(doi)
+            else:
+                self._emit(doi)
+
+    def collection_done(self) -> None:
+        """После окончания сбора записи больше не меняются: выпускаем отложенные результаты"""
+        with self.emit_lock:
+            self.collecting = False
+            for doi in self.pending:
+                self._emit(doi)
+            self.pending = []
+
+@stage_logger("Stages 2-3: Pipelined collection and processing")
+def stage_pipeline(store: DoiStore, issns: List[str], keywords: List[str],
+                   date_from: Optional[str], date_to: Optional[str],
+                   rows: int, shard_by_month: bool,
+                   pirate_urls: List[str], check_rg: bool,
+                   result_store: Optional[CheckResultStore] = None,
+                   sink: Optional[Callable[[Dict[str, Any]], None]] = None,
+                   queue_size: Optional[int] = None,
+                   deadline: Optional[float] = None,
+                   plan_queries: bool = False) -> List[Dict[str, Any]]:
+    """
+    Конвейерный режим этапов 2 и 3: новые уникальные DOI попадают в ограниченную очередь
+    и проверяются, пока сбор ещё идёт. Уже сохранённые в хранилище DOI подаются в ту же очередь.
+
+    Дедупликация: каждый DOI проверяется один раз; если позже приходит версия
+    с большим reference-count, обновляется только запись, проверки не повторяются.
+    Результаты возвращаются (или передаются в sink) как в orchestrator.stage_process_dois.
+    """
+    from playwright_utils import browser_pool
+
+    max_workers: int = get_concurrency_settings()
+    check_workers: int = CHECKS_PER_DOI * max_workers
+    doi_queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=queue_size or 2 * max_workers)
+    state = _PipelineState(sink)
+    pbar = tqdm(desc="DOIs checked", ncols=100)
+
+    aborted = threading.Event()
+
+    def _put(doi: Optional[str]) -> None:
+        # put с таймаутом, чтобы производители не зависли на полной очереди после сбоя
+        while not aborted.is_set():
+            try:
+                doi_queue.put(doi, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _check_worker() -> None:
+        while not aborted.is_set():
+            try:
+                doi: Optional[str] = doi_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if doi is _STOP:
+                return
+            with state.works_lock:
+                work: Work = state.works[doi]
+            try:
+                state.finished(doi, run_doi_checks(doi, work, pirate_urls, check_rg,
+                                                   result_store, checks, deadline))
+            except Exception as e:
+                # один сбойный DOI не должен останавливать весь конвейер;
+                # в выгрузку он попадает с "unknown", как при дедлайне
+                print(f"Error processing {doi}: {e}")
+                metrics.inc("pipeline.failed")
+                state.finished(doi, unknown_checks(pirate_urls, check_rg))
+            pbar.update(1)
+
+    def _feed_stored() -> None:
+        # сохранённые DOI — только найденные запросами текущих ISSN, ключевых слов и интервала
+        for doi, work in store.scoped(issns, keywords, date_from, date_to).items():
+            if aborted.is_set():
+                return
+            if state.claim(doi, work):
+                _put(doi)
+
+    jobs: List[CollectionJob] = plan_collection_jobs(store, issns, keywords, date_from, date_to,
+                                                     rows, shard_by_month, plan_queries)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as checkers, \
+            ThreadPoolExecutor(max_workers=check_workers) as checks_pool, \
+            ThreadPoolExecutor(max_workers=max_workers + 1) as collectors:
+        checks = BoundedExecutor(checks_pool, check_workers)
+        workers = [checkers.submit(_check_worker) for _ in range(max_workers)]
+        futures = {}
+        try:
+            feeder = collectors.submit(_feed_stored)
+
+            futures = {collectors.submit(fetch): covered for fetch, covered in jobs}
+            for future in as_completed(futures):
+                items: List[Work] = save_collection_result(store, future.result())
+                for it in items:
+                    doi_norm = it.doi.strip().lower()
+                    if doi_norm and state.claim(doi_norm, it):
+                        _put(doi_norm)
+
+            feeder.result()
+        except BaseException:
+            aborted.set()
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            if not aborted.is_set():
+                state.collection_done()
+                print("Total unique DOIs found:", len(state.works))
+                for _ in workers:
+                    _put(_STOP)
+            for w in workers:
+                w.result()
+
+    pbar.close()
+    browser_pool.close_all()
+    return state.results
@@ -1,4 +1,76 @@
-from playwright.sync_api import sync_playwright
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import metrics
+
+if TYPE_CHECKING:
+    from playwright.sync_api import Page, Route
+
+T = TypeVar("T")
+
+BROWSER_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-web-security',
+    '--disable-features=VizDisplayCompositor',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage'
+]
+
+CONTEXT_OPTIONS: Dict[str, Any] = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'extra_http_headers': {
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    }
+}
+
+# Облегчённый режим страниц: проверкам нужны только итоговый URL и DOM,
+# поэтому запросы этих типов и к известным трекерам прерываются
+LEAN_BLOCKED_TYPES = {"image", "font", "stylesheet", "media"}
+TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "adservice.google.com", "facebook.net", "connect.facebook.net", "hotjar.com",
+    "scorecardresearch.com", "newrelic.com", "nr-data.net", "segment.com", "segment.io",
+    "quantserve.com", "crazyegg.com", "optimizely.com", "cookielaw.org", "onetrust.com",
+    "addthis.com", "criteo.com", "adnxs.com", "bing.com", "clarity.ms",
+)
+# Оценка размера прерванного ответа по типу ресурса (сам ответ не загружается), байт
+ESTIMATED_BYTES = {"image": 40_000, "font": 35_000, "stylesheet": 25_000,
+                   "media": 500_000, "script": 30_000}
+DEFAULT_ESTIMATED_BYTES = 10_000
+# Сколько страниц каждого режима держать открытыми в одной сессии для повторного использования
+PAGE_POOL_SIZE = 2
+
+def lean_block_estimate(resource_type: str, url: str) -> Optional[int]:
+    """
+    Решает, нужно ли прервать запрос в облегчённом режиме.
+    Возвращает оценку сэкономленных байт или None, если запрос нужно выполнить.
+    """
+    host = (urlsplit(url).hostname or "").lower()
+    if resource_type in LEAN_BLOCKED_TYPES or any(
+            host == t or host.endswith("." + t) for t in TRACKER_HOSTS):
+        return ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+    return None
+
+def record_lean_block(saved: int) -> None:
+    metrics.inc("browser.lean.blocked_requests")
+    metrics.inc("browser.lean.bytes_saved_estimate", saved)
+
+def _lean_route(route: "Route") -> None:
+    saved: Optional[int] = lean_block_estimate(route.request.resource_type, route.request.url)
+    if saved is None:
+        route.continue_()
+        return
+    record_lean_block(saved)
+    route.abort()
 
 class BrowserSession:
     def __init__(self, headless: bool = True):
@@ -6,38 +78,206 @@ class BrowserSession:
         self.playwright = None
         self.browser = None
         self.context = None
+        # свободные страницы для повторного использования: обычные и облегчённые
+        self._pages: Dict[bool, List["Page"]] = {False: [], True: []}
 
     def __enter__(self):
+        # Playwright загружается только при первом запуске браузера
+        from playwright.sync_api import sync_playwright
+
         self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(
-            headless=self.headless,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-web-security',
-                '--disable-features=VizDisplayCompositor',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-dev-shm-usage'
-            ]
-        )
-        self.context = self.browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            extra_http_headers={
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-        )
-        self.context.set_default_timeout(30000)
+        self.browser = self.playwright.chromium.launch(headless=self.headless, args=BROWSER_ARGS)
+        metrics.inc("browser.launches")
+        self.new_context()
         return self
 
+    def new_context(self) -> None:
+        """Закрывает текущий контекст (если он есть) и открывает новый с теми же настройками."""
+        self._pages = {False: [], True: []}
+        if self.context:
+            try:
+                self.context.close()
+            except Exception:
+                pass
+        self.context = self.browser.new_context(**CONTEXT_OPTIONS)
+        self.context.set_default_timeout(30000)
+
+    @contextmanager
+    def page(self, lean: bool = False) -> Iterator["Page"]:
+        """
+        Выдаёт страницу текущего контекста, по возможности уже открытую ранее.
+        В облегчённом режиме (lean) страница прерывает загрузку изображений, шрифтов,
+        стилей, медиа и трекеров; число прерванных запросов и оценка сэкономленных
+        байт пишутся в счётчики browser.lean.* (в расчёте на страницу — делением
+        на browser.lean.pages).
+        Страница, на которой произошла ошибка, закрывается, а не возвращается в пул.
+        """
+        pool: List["Page"] = self._pages[lean]
+        page: Optional["Page"] = None
+        while pool and page is None:
+            candidate = pool.pop()
+            if not candidate.is_closed():
+                page = candidate
+        if page is None:
+            page = self.context.new_page()
+            if lean:
+                page.route("**/*", _lean_route)
+        else:
+            metrics.inc("browser.pages_reused")
+        if lean:
+            metrics.inc("browser.lean.pages")
+
+        try:
+            yield page
+        except BaseException:
+            try:
+                page.close()
+            except Exception:
+                pass
+            raise
+
+        if len(pool) < PAGE_POOL_SIZE and not page.is_closed():
+            pool.append(page)
+        else:
+            page.close()
+
+    def is_alive(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.context:
             self.context.close()
         if self.browser:
             self.browser.close()
         if self.playwright:
-            self.playwright.stop()
\ No newline at end of file
+            self.playwright.stop()
+
+class BrowserPool:
+    """
+    Пул «тёплых» браузеров: по одному BrowserSession на рабочий поток.
+    Синхронный Playwright привязан к потоку, в котором он запущен, поэтому
+    сессия создаётся лениво при первой аренде и используется только этим потоком.
+
+    Браузерные проверки выполняются через run в собственных потоках пула, которых
+    не больше max_sessions (по умолчанию get_concurrency_settings()), поэтому число
+    запущенных браузеров не зависит от числа потоков, из которых идут проверки.
+
+    Контекст пересоздаётся после max_pages открытых страниц, а весь браузер —
+    после сбоя внутри аренды.
+    """
+    def __init__(self, headless: bool = False, max_pages: int = 50,
+                 max_sessions: Optional[int] = None):
+        self.headless = headless
+        self.max_pages = max_pages
+        self.max_sessions = max_sessions
+        # облегчённый режим страниц по типам проверок, например {"researchgate": True}
+        self.lean: Dict[str, bool] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions: List[BrowserSession] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers = 0
+
+    def configure(self, cfg: Dict[str, Any]) -> None:
+        self.headless = cfg.get("headless", self.headless)
+        self.max_pages = cfg.get("max_pages_per_context", self.max_pages)
+        self.max_sessions = cfg.get("max_sessions", self.max_sessions)
+        self.lean.update(cfg.get("lean_pages", {}))
+
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Выполняет fn (которая арендует сессию через lease) в одном из потоков пула
+        и возвращает её результат; вызывающий поток ждёт, пока освободится браузер.
+        """
+        with self._lock:
+            if self._executor is None:
+                from config import get_concurrency_settings
+                self._workers = max(1, self.max_sessions or get_concurrency_settings())
+                self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                    thread_name_prefix="browser")
+            executor = self._executor
+        return executor.submit(fn, *args).result()
+
+    def is_lean(self, check: str) -> bool:
+        """Включён ли облегчённый режим страниц для проверки check"""
+        return self.lean.get(check, False)
+
+    @contextmanager
+    def lease(self) -> Iterator[BrowserSession]:
+        """Выдаёт сессию текущего потока, при необходимости запуская браузер."""
+        session: Optional[BrowserSession] = getattr(self._local, "session", None)
+        if session is None or not session.is_alive():
+            self._discard_current()
+            session = BrowserSession(headless=self.headless).__enter__()
+            self._local.session = session
+            self._local.pages = 0
+            with self._lock:
+                self._sessions.append(session)
+        elif self._local.pages >= self.max_pages:
+            session.new_context()
+            self._local.pages = 0
+
+        self._local.pages += 1
+        try:
+            yield session
+        except Exception:
+            # браузер мог упасть — следующая аренда запустит новый
+            self._discard_current()
+            raise
+
+    def _discard_current(self) -> None:
+        session: Optional[BrowserSession] = getattr(self._local, "session", None)
+        self._local.session = None
+        if session is None:
+            return
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+        try:
+            session.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    def close_current(self) -> None:
+        """Закрывает сессию вызывающего потока (вызывается из рабочего потока)."""
+        self._discard_current()
+
+    def drain(self, executor, workers: int) -> None:
+        """
+        Закрывает сессии во всех потоках пула executor.
+        Каждая задача ждёт на барьере, поэтому все workers задач гарантированно
+        выполняются в разных потоках и каждая закрывает «свою» сессию.
+        """
+        barrier = threading.Barrier(workers)
+
+        def _close() -> None:
+            try:
+                barrier.wait(timeout=30)
+            except threading.BrokenBarrierError:
+                pass
+            self.close_current()
+
+        for future in [executor.submit(_close) for _ in range(workers)]:
+            future.result()
+
+    def close_all(self) -> None:
+        """
+        Закрывает сессии в потоках пула (браузеры привязаны к своим потокам,
+        поэтому закрываются там же), останавливает эти потоки и закрывает
+        оставшиеся сессии (например, открытые в главном потоке).
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            self.drain(executor, self._workers)
+            executor.shutdown()
+        self._discard_current()
+        with self._lock:
+            leftovers, self._sessions = self._sessions, []
+        for session in leftovers:
+            try:
+                session.__exit__(None, None, None)
+            except Exception:
+                pass
+
+browser_pool = BrowserPool()
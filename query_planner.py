@@ -0,0 +1,164 @@
+import json
+import math
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import DefaultDict, Dict, Any, List, Optional, Set, Tuple
+
+import metrics
+from config import get_concurrency_settings
+from crossref_client import CROSSREF_SELECT, IncompleteFetchError, fetch_pages, probe_total
+from orchestrator import CollectionJob, CollectionUnit, UnitResult, fetch_unit
+from work import Work
+
+# Для локального сопоставления дополнительно запрашиваются подзаголовок и аннотация
+MATCH_SELECT = CROSSREF_SELECT + ",subtitle,abstract"
+MATCH_FIELDS = ("title", "subtitle", "abstract")
+
+STOPWORDS = {"a", "an", "and", "for", "in", "of", "on", "the", "to", "with"}
+_TAG = re.compile(r"<[^>]+>")
+_TOKEN = re.compile(r"[^\W_]+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Разбивает текст на слова в нижнем регистре без стоп-слов и JATS-разметки.
+    Окончание -s отбрасывается, чтобы «attacks» и «attack» совпадали.
+    """
+    tokens = []
+    for token in _TOKEN.findall(_TAG.sub(" ", text).lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def match_text(item: Dict[str, Any]) -> str:
+    """Текст элемента CrossRef, по которому ищутся ключевые слова"""
+    parts = []
+    for field in MATCH_FIELDS:
+        value = item.get(field)
+        if isinstance(value, list):
+            parts.extend(str(v) for v in value)
+        elif value:
+            parts.append(str(value))
+    return " ".join(parts)
+
+class KeywordIndex:
+    """
+    Инвертированный индекс «слово → номера документов» для одного интервала ISSN.
+    Ключевое слово совпадает с документом, если в нём есть все слова ключевого слова.
+    """
+    def __init__(self):
+        self.postings: DefaultDict[str, Set[int]] = defaultdict(set)
+
+    def add(self, doc_id: int, text: str) -> None:
+        for token in tokenize(text):
+            self.postings[token].add(doc_id)
+
+    def match(self, keyword: str) -> Set[int]:
+        tokens = tokenize(keyword)
+        if not tokens:
+            return set()
+        postings = sorted((self.postings.get(t, set()) for t in tokens), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+def pages_needed(total: int, rows: int) -> int:
+    """Сколько запросов нужно, чтобы выгрузить total записей страницами по rows"""
+    return max(1, math.ceil(total / max(1, rows)))
+
+def fetch_window_matching(issn: str, date_from: Optional[str], date_to: Optional[str],
+                          keywords: List[str], naive_hits: int,
+                          rows: int = 100) -> Dict[CollectionUnit, UnitResult]:
+    """
+    Выгружает все публикации ISSN за интервал одним запросом и для каждого из keywords
+    оставляет записи, содержащие его в названии, подзаголовке или аннотации.
+    Результат — по единицам сбора (issn, ключевое слово, интервал), как у orchestrator.fetch_unit;
+    при сбое на одной из страниц все единицы получают совпавшие записи и признак неполноты.
+    naive_hits — сумма total-results по ключевым словам, для оценки сэкономленных байт.
+    """
+    index = KeywordIndex()
+    works: List[Work] = []
+    fetched_bytes = 0
+    lean_bytes = 0
+    complete = True
+
+    try:
+        for items, page_bytes in fetch_pages(issn, None, date_from, date_to, rows, MATCH_SELECT):
+            fetched_bytes += page_bytes
+            for item in items:
+                index.add(len(works), match_text(item))
+                # размер той же записи в ответе на обычный запрос по ключевому слову
+                lean_bytes += len(json.dumps({k: v for k, v in item.items() if k not in ("subtitle", "abstract")}))
+                works.append(Work.from_item(item))
+    except IncompleteFetchError:
+        complete = False
+
+    result: Dict[CollectionUnit, UnitResult] = {}
+    matched: Set[int] = set()
+    for kw in keywords:
+        kw_matched: Set[int] = index.match(kw)
+        matched |= kw_matched
+        result[(issn, kw, date_from, date_to)] = ([works[i] for i in sorted(kw_matched)], complete)
+
+    if works and complete:
+        naive_bytes = naive_hits * lean_bytes / len(works)
+        metrics.inc("query_planner.bytes_fetched", fetched_bytes)
+        metrics.inc("query_planner.bytes_saved_estimate", int(naive_bytes - fetched_bytes))
+    metrics.inc("query_planner.window_items", len(works))
+    metrics.inc("query_planner.window_matched", len(matched))
+    return result
+
+def plan_queries(units: List[CollectionUnit], rows: int = 100) -> List[CollectionJob]:
+    """
+    Выбирает для каждой пары (ISSN, интервал) дешевле из двух планов:
+      - по запросу на каждое ключевое слово (как без планировщика),
+      - одна выгрузка всего интервала с локальным поиском ключевых слов.
+    Стоимость оценивается запросами rows=0: total-results для каждого ключевого слова
+    и для интервала целиком. Интервал выгружается целиком, если в нём меньше записей,
+    чем сумма найденных по ключевым словам.
+    """
+    groups: DefaultDict[Tuple[str, Optional[str], Optional[str]], List[str]] = defaultdict(list)
+    for issn, kw, w_from, w_to in units:
+        groups[(issn, w_from, w_to)].append(kw)
+
+    # интервалы с одним ключевым словом планировать незачем
+    probed = [key for key, kws in groups.items() if len(kws) > 1]
+    probes: List[Tuple[str, Optional[str], Optional[str], Optional[str]]] = [
+        (issn, kw, w_from, w_to) for issn, w_from, w_to in probed for kw in [None] + groups[(issn, w_from, w_to)]
+    ]
+    with ThreadPoolExecutor(max_workers=get_concurrency_settings()) as executor:
+        totals: Dict[Tuple[str, Optional[str], Optional[str], Optional[str]], Optional[int]] = dict(
+            zip(probes, executor.map(lambda p: probe_total(*p), probes))
+        )
+
+    jobs: List[CollectionJob] = []
+    # сравниваются только интервалы с оценкой; пробные запросы — накладные расходы плана
+    naive_requests = 0
+    planned_requests = len(probes)
+    windows = 0
+    for (issn, w_from, w_to), kws in groups.items():
+        window_units: List[CollectionUnit] = [(issn, kw, w_from, w_to) for kw in kws]
+        window_total: Optional[int] = totals.get((issn, None, w_from, w_to))
+        hits: List[Optional[int]] = [totals.get((issn, kw, w_from, w_to)) for kw in kws]
+
+        if len(kws) > 1 and window_total is not None and None not in hits:
+            naive_cost: int = sum(pages_needed(h, rows) for h in hits)
+            naive_requests += naive_cost
+            if window_total < sum(hits):
+                windows += 1
+                planned_requests += pages_needed(window_total, rows)
+                jobs.append((partial(fetch_window_matching, issn, w_from, w_to, kws, sum(hits), rows),
+                             window_units))
+                continue
+            planned_requests += naive_cost
+        jobs.extend((partial(fetch_unit, unit, rows), [unit]) for unit in window_units)
+
+    saved: int = naive_requests - planned_requests
+    metrics.inc("query_planner.probes", len(probes))
+    metrics.inc("query_planner.requests_saved_estimate", saved)
+    print(f"Query plan: {windows} of {len(groups)} ISSN windows fetched whole; "
+          f"estimated requests {planned_requests} instead of {naive_requests} "
+          f"(including {len(probes)} probes), saved {saved}")
+    return jobs
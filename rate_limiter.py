@@ -0,0 +1,143 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Mapping
+from urllib.parse import urlsplit
+
+import metrics
+
+# Начальная скорость (запросов в секунду) до получения заголовков X-Rate-Limit-*
+RATE_LIMITS: Dict[str, float] = {"api.crossref.org": 10}
+# Скорость для хостов без явного ограничения, которым пришёл Retry-After
+UNTHROTTLED_RATE = 1000.0
+
+class TokenBucket:
+    """
+    Потокобезопасное «ведро токенов» для одного хоста.
+    rate — токенов в секунду, capacity — допустимый всплеск запросов.
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Блокирует поток, пока не появится свободный токен"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            metrics.inc("rate_limiter.waits")
+            time.sleep(wait)
+
+    def set_rate(self, limit: float, interval: float) -> None:
+        """Устанавливает скорость limit запросов за interval секунд (нулевые значения игнорируются)"""
+        if limit <= 0 or interval <= 0:
+            return
+        with self._lock:
+            self.rate = limit / interval
+            self.capacity = max(1.0, limit)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def pause(self, seconds: float) -> None:
+        """Запрещает запросы к хосту на seconds секунд (Retry-After)"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+            # токены начинают копиться только после окончания паузы, без всплеска сразу после неё
+            self.updated = self.blocked_until
+
+_lock = threading.Lock()
+_buckets: Dict[str, TokenBucket] = {}
+
+def configure(cfg: Dict[str, Any]) -> None:
+    """
+    Применяет начальные ограничения из секции "rate_limits" конфигурации.
+    Неположительная частота пропускается (как в TokenBucket.set_rate).
+    """
+    limits: Dict[str, float] = {}
+    for host, rate in cfg.items():
+        if rate <= 0:
+            print(f"Warning: Ignoring rate limit {rate} for {host}: rate must be positive")
+            continue
+        limits[host] = rate
+    RATE_LIMITS.update(limits)
+    with _lock:
+        for host, rate in limits.items():
+            if host in _buckets:
+                _buckets[host].set_rate(rate, 1)
+
+def _host(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+def _bucket(host: str, create: bool = False) -> Optional[TokenBucket]:
+    with _lock:
+        bucket = _buckets.get(host)
+        if bucket is None and (create or host in RATE_LIMITS):
+            bucket = TokenBucket(RATE_LIMITS.get(host, UNTHROTTLED_RATE))
+            _buckets[host] = bucket
+        return bucket
+
+def acquire(url: str) -> None:
+    """Ожидает разрешения на запрос к хосту url (хосты без ограничений не ждут)"""
+    bucket = _bucket(_host(url))
+    if bucket is not None:
+        bucket.acquire()
+
+def parse_interval(value: str) -> Optional[float]:
+    """Разбирает X-Rate-Limit-Interval вида "1s", "500ms" или "1m" """
+    value = value.strip().lower()
+    try:
+        if value.endswith("ms"):
+            return float(value[:-2]) / 1000
+        if value.endswith("s"):
+            return float(value[:-1])
+        if value.endswith("m"):
+            return float(value[:-1]) * 60
+        return float(value)
+    except ValueError:
+        return None
+
+def parse_retry_after(value: str) -> Optional[float]:
+    """Retry-After может быть числом секунд или HTTP-датой"""
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def update_from_response(url: str, status: int, headers: Mapping[str, str]) -> None:
+    """
+    Подстраивает ограничение хоста по ответу сервера:
+      - X-Rate-Limit-Limit / X-Rate-Limit-Interval (CrossRef) задают скорость;
+      - Retry-After при 429/503 приостанавливает запросы к хосту.
+    """
+    host = _host(url)
+    limit = headers.get("X-Rate-Limit-Limit")
+    interval = headers.get("X-Rate-Limit-Interval")
+    if limit and interval:
+        seconds = parse_interval(interval)
+        try:
+            if seconds:
+                _bucket(host, create=True).set_rate(float(limit), seconds)
+        except ValueError:
+            pass
+
+    if status in (429, 503):
+        metrics.inc(f"rate_limiter.throttled.{status}")
+        retry_after = parse_retry_after(headers.get("Retry-After", "") or "")
+        if retry_after is not None:
+            _bucket(host, create=True).pause(retry_after)
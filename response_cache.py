@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import metrics
+
+# Заголовки ответа, которые сохраняются вместе с телом
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "X-Rate-Limit-Limit", "X-Rate-Limit-Interval")
+
+class CachedResponse:
+    """Запись кэша: тело ответа и данные для условного запроса"""
+    __slots__ = ("status", "headers", "body", "stored_at")
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes, stored_at: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+
+    def validators(self) -> Dict[str, str]:
+        """Заголовки условного запроса (If-None-Match / If-Modified-Since), если сервер их поддерживает"""
+        result = {}
+        if self.headers.get("ETag"):
+            result["If-None-Match"] = self.headers["ETag"]
+        if self.headers.get("Last-Modified"):
+            result["If-Modified-Since"] = self.headers["Last-Modified"]
+        return result
+
+    def to_response(self, url: str) -> requests.Response:
+        r = requests.Response()
+        r.status_code = self.status
+        r.headers = CaseInsensitiveDict(self.headers)
+        r._content = self.body
+        r.url = url
+        r.encoding = "utf-8"
+        return r
+
+class ResponseCache:
+    """
+    Кэш HTTP-ответов на диске.
+    Тела хранятся сжатыми (gzip) в файлах с именем по SHA-256 содержимого, поэтому
+    одинаковые ответы на разные запросы занимают место один раз; индекс — в SQLite.
+    Запись свежа ttl секунд, после этого её можно подтвердить условным запросом
+    (ETag / Last-Modified). При превышении max_bytes удаляются давно не использованные записи.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            body_hash TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            headers TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            stored_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access);
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(os.path.join(path, "bodies"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def key_for(url: str, params: Optional[Mapping[str, Any]] = None) -> str:
+        """Нормализованный ключ: схема и хост в нижнем регистре, параметры отсортированы"""
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        query += [(k, str(v)) for k, v in (params or {}).items() if v is not None]
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/",
+                           urlencode(sorted(query)), ""))
+
+    def _body_path(self, body_hash: str) -> str:
+        return os.path.join(self.path, "bodies", body_hash[:2], body_hash + ".gz")
+
+    def get(self, key: str) -> Tuple[Optional[CachedResponse], bool]:
+        """Возвращает (запись или None, свежа ли она)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body_hash, status, headers, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None, False
+        body_hash, status, headers, stored_at = row
+        try:
+            with gzip.open(self._body_path(body_hash), "rb") as f:
+                body = f.read()
+        except OSError:
+            # файл тела удалён или повреждён — считаем записи нет
+            return None, False
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        entry = CachedResponse(status, json.loads(headers), body, stored_at)
+        return entry, time.time() - stored_at < self.ttl
+
+    def put(self, key: str, response: requests.Response) -> None:
+        headers = {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers}
+        self._put_body(key, response.status_code, headers, response.content)
+
+    def get_chain(self, key: str) -> Optional[List[bytes]]:
+        """
+        Тела страниц цепочки курсорных запросов, если вся цепочка сохранена и свежа.
+        Устаревшая цепочка не подтверждается условными запросами: курсоры CrossRef
+        со временем истекают, поэтому цепочка выгружается заново целиком.
+        """
+        entry, fresh = self.get(key)
+        if entry is None or not fresh:
+            return None
+        return [page.encode("utf-8") for page in json.loads(entry.body)]
+
+    def put_chain(self, key: str, pages: List[bytes]) -> None:
+        """Сохраняет полностью выгруженную цепочку страниц одной записью (и вытесняется она целиком)"""
+        body = json.dumps([page.decode("utf-8") for page in pages], ensure_ascii=False).encode("utf-8")
+        self._put_body(key, 200, {}, body)
+
+    def _put_body(self, key: str, status: int, headers: Dict[str, str], body: bytes) -> None:
+        body_hash: str = hashlib.sha256(body).hexdigest()
+        path = self._body_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp, "wb", compresslevel=6) as f:
+                f.write(body)
+            os.replace(tmp, path)
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, body_hash, status, headers, size, stored_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, body_hash, status, json.dumps(headers), os.path.getsize(path), now, now)
+            )
+        self._evict()
+
+    def touch(self, key: str) -> None:
+        """Продлевает срок записи после ответа 304 Not Modified"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET stored_at = ?, last_access = ? WHERE key = ?", (now, now, key))
+
+    def _evict(self) -> None:
+        """Удаляет давно не использованные записи, пока общий размер тел больше max_bytes"""
+        with self._lock, self._conn:
+            # тело, общее для нескольких записей, учитывается один раз
+            total: int = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT body_hash, size FROM entries)"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            removed: List[str] = []
+            for key, body_hash, size in self._conn.execute(
+                    "SELECT key, body_hash, size FROM entries ORDER BY last_access").fetchall():
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                still_used = self._conn.execute(
+                    "SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", (body_hash,)
+                ).fetchone()
+                if not still_used:
+                    removed.append(body_hash)
+                    total -= size
+                metrics.inc("response_cache.evicted")
+                if total <= self.max_bytes:
+                    break
+        for body_hash in removed:
+            try:
+                os.remove(self._body_path(body_hash))
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_cache: Optional[ResponseCache] = None
+
+def configure(cfg: Dict[str, Any]) -> None:
+    """
+    Включает кэш по секции "response_cache":
+      - enabled: включён ли кэш (по умолчанию нет),
+      - path: каталог кэша,
+      - max_mb: предельный размер сжатых тел,
+      - ttl_hours: сколько часов ответ используется без обращения к серверу.
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    if cfg.get("enabled", False):
+        _cache = ResponseCache(cfg.get("path", "http_cache"),
+                               int(cfg.get("max_mb", 500) * 2**20),
+                               cfg.get("ttl_hours", 24) * 3600)
+
+def get_cache() -> Optional[ResponseCache]:
+    return _cache
+
+def report_stats() -> None:
+    """Переносит долю попаданий в кэш в metrics (в процентах от всех обращений)"""
+    data: Dict[str, int] = metrics.snapshot()
+    hits = data.get("response_cache.hit", 0) + data.get("response_cache.revalidated", 0)
+    total = hits + data.get("response_cache.miss", 0)
+    if total:
+        metrics.set_value("response_cache.hit_ratio_pct", round(100 * hits / total))
@@ -1,6 +1,5 @@
 import config
-from orchestrator import stage_process_dois
-from cache_manager import load_doi_cache
+from orchestrator import stage_process_dois, open_doi_store
 from typing import Dict, Any
 import asyncio
 from itertools import islice
@@ -8,16 +7,28 @@ from itertools import islice
 async def test(sample_size=10):
     cfg = config.load_config()
 
-    cache_path: str = cfg.get("doi_cache_path", "cached_dois.json")
-    dois_data: Dict[str, Any] = load_doi_cache(cache_path)
+    dois_data = open_doi_store(cfg)
 
     subset = dict(islice(dois_data.items(), sample_size))
 
-    results = stage_process_dois(
-        subset,
-        cfg.get("pirate_urls", []),
-        cfg.get("check_researchgate", False)
-    )
+    if cfg.get("engine", "threads") == "async":
+        from async_engine import stage_process_dois_async
+
+        async_cfg: Dict[str, Any] = cfg.get("async", {})
+        results = await stage_process_dois_async(
+            subset,
+            cfg.get("pirate_urls", []),
+            cfg.get("check_researchgate", False),
+            concurrency=async_cfg.get("concurrency", 200),
+            browser_pages=async_cfg.get("browser_pages", 16),
+            headless=cfg.get("browser", {}).get("headless", False)
+        )
+    else:
+        results = stage_process_dois(
+            subset,
+            cfg.get("pirate_urls", []),
+            cfg.get("check_researchgate", False)
+        )
 
     config.save_results(results, cfg)
 
@@ -1,48 +1,28 @@
 import os.path
 import subprocess
 from typing import Dict, Any, List
+from work import Work
 
-def normalize_item(doi: str, raw_data: Dict[str, Any],
+def normalize_item(doi: str, raw_data: Work,
                    pub_av: Dict[str, Any], pirate_res: Dict[str, Any],
                    rg: str) -> Dict[str, Any]:
     """
-    Приведение «сырых» данных о статье к единому формату для сохранения.
+    Приведение данных о статье к единому формату для сохранения.
 
     :param doi: Идентификатор статьи
-    :param raw_data: Исходные данные из CrossRef
+    :param raw_data: Запись CrossRef (work.Work)
     :param pub_av: Доступность статьи у издателя
     :param pirate_res: Результаты проверки на пиратских ресурсах
     :param rg: Статус наличия статьи на ResearchGate
     :return: Словарь с единообразными полями (год публикации, авторы, название статьи и др.)
     """
-    # Заголовок
-    title: str = raw_data.get("title", [""])[0] if raw_data.get("title") else ""
+    # Проверка пиратских ресурсов (None — проверка не успела завершиться или ресурс отключён)
+    pirates_any = pirate_res.get("pirates_any")
+    pirates_yesno = "unknown" if pirates_any is None else ("yes" if pirates_any else "no")
 
-    # Список авторов
-    authors = []
-    for a in raw_data.get("author", []):
-        g: str = a.get("given","").strip()
-        f: str = a.get("family","").strip()
-        authors.append((g + " " + f).strip())
-
-    # Определение года публикации
-    year = None
-    for k in ("published", "published-online", "issued", "created"):
-        v = raw_data.get(k)
-        if v and isinstance(v, dict):
-            dp = v.get("date-parts")
-            if dp and len(dp) > 0 and len(dp[0]) > 0:
-                year = dp[0][0]
-                break
-
-    # Количество цитирований
-    citations: int = raw_data.get("reference-count", 0)
-
-    # Ссылка на страницу статьи
-    url: str = raw_data.get("URL", "")
-
-    # Проверка пиратских ресурсов
-    pirates_yesno = "yes" if pirate_res.get("pirates_any") else "no"
+    # Наличие PDF у издателя (None — проверка не успела завершиться или хост отключён)
+    publisher_pdf = pub_av.get("publisher_pdf")
+    on_site = "unknown" if publisher_pdf is None else ("yes" if publisher_pdf else "no")
 
     # Проверка ResearchGate
     rg_status = "no"
@@ -52,13 +32,13 @@ def normalize_item(doi: str, raw_data: Dict[str, Any],
         rg_status = "maybe"
 
     return {
-        "year": year,
-        "authors": "; ".join(authors),
-        "title": title,
+        "year": raw_data.year,
+        "authors": "; ".join(raw_data.authors),
+        "title": raw_data.title,
         "doi": doi,
-        "citations": citations,
-        "link": url,
-        "available_on_site": "yes" if pub_av.get("publisher_pdf") else "no",
+        "citations": raw_data.reference_count,
+        "link": raw_data.url,
+        "available_on_site": on_site,
         "researchgate": rg_status,
         "pirates": pirates_yesno
     }
@@ -0,0 +1,74 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+class Work:
+    """
+    Компактная запись о публикации CrossRef.
+    Создаётся сразу при получении ответа API и хранит только поля, которые
+    используют utils.normalize_item и проверки доступности; остальная часть
+    ответа (reference, funder, license, assertion и т. д.) отбрасывается.
+    """
+    __slots__ = ("doi", "title", "authors", "year", "reference_count", "url", "links")
+
+    def __init__(self, doi: str, title: str = "", authors: Tuple[str, ...] = (),
+                 year: Optional[int] = None, reference_count: int = 0, url: str = "",
+                 links: Tuple[Tuple[str, str], ...] = ()):
+        self.doi = doi
+        self.title = title
+        self.authors = authors
+        self.year = year
+        self.reference_count = reference_count
+        self.url = url
+        # пары (URL, content-type) из массива link
+        self.links = links
+
+    @classmethod
+    def from_item(cls, item: Dict[str, Any]) -> "Work":
+        """Извлекает нужные поля из «сырого» элемента CrossRef"""
+        titles = item.get("title")
+        title: str = titles[0] if titles else ""
+
+        authors = []
+        for a in item.get("author", []):
+            g: str = a.get("given", "").strip()
+            f: str = a.get("family", "").strip()
+            authors.append((g + " " + f).strip())
+
+        # Определение года публикации
+        year = None
+        for k in ("published", "published-online", "issued", "created"):
+            v = item.get(k)
+            if v and isinstance(v, dict):
+                dp = v.get("date-parts")
+                if dp and len(dp) > 0 and len(dp[0]) > 0:
+                    year = dp[0][0]
+                    break
+
+        links = tuple(
+            (l.get("URL", ""), l.get("content-type", ""))
+            for l in item.get("link", [])
+        )
+
+        return cls(item.get("DOI", ""), title, tuple(authors), year,
+                   item.get("reference-count", 0) or 0, item.get("URL", ""), links)
+
+    def to_row(self) -> List[Any]:
+        """Компактное представление для кэша: список значений в порядке __slots__"""
+        return [self.doi, self.title, list(self.authors), self.year,
+                self.reference_count, self.url, [list(l) for l in self.links]]
+
+    @classmethod
+    def from_row(cls, row: Any) -> "Work":
+        """Обратное к to_row; словарь (формат старого кэша) разбирается через from_item"""
+        if isinstance(row, dict):
+            return cls.from_item(row)
+        doi, title, authors, year, reference_count, url, links = row
+        return cls(doi, title, tuple(authors), year, reference_count, url,
+                   tuple((u, ct) for u, ct in links))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Work):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"Work(doi={self.doi!r}, title={self.title!r}, reference_count={self.reference_count})"
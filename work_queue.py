@@ -0,0 +1,340 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import metrics
+from config import get_concurrency_settings
+from decorators import stage_logger
+from orchestrator import (CHECKS_PER_DOI, BoundedExecutor, configure_clients, open_result_store,
+                          process_single_doi_item, unknown_checks)
+from utils import normalize_item
+from work import Work
+
+# Состояния задачи в очереди
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+class WorkQueue:
+    """
+    Очередь DOI для этапа 3 в файле SQLite, общая для нескольких процессов
+    (и машин, если файл лежит на общем диске с рабочими блокировками файлов, например SMB
+    или NFS с lockd). Журнал — обычный rollback journal, а не WAL: WAL требует общей памяти
+    на одном компьютере и не работает на сетевых дисках.
+    Воркер забирает задачи пачкой и получает на них аренду (lease) на visibility_timeout секунд.
+    Если воркер не отчитался и не продлил аренду вовремя, задача снова становится доступной другим.
+    Задача, сорвавшаяся max_attempts раз, помечается как failed.
+    В задаче хранится сама запись Work, поэтому воркеру не нужно хранилище DOI.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            doi TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            owner TEXT,
+            lease_until REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS tasks_state ON tasks(state, lease_until);
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # isolation_level=None: транзакции открываются явно (BEGIN IMMEDIATE в claim)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.executescript(self.SCHEMA)
+
+    def enqueue(self, items: Iterable[Tuple[str, Work]], batch_size: int = 500) -> int:
+        """Добавляет DOI, которых ещё нет в очереди. Возвращает число добавленных"""
+        added = 0
+        batch: List[Tuple[str, str]] = []
+        for doi, work in items:
+            batch.append((doi, json.dumps(work.to_row(), ensure_ascii=False, separators=(",", ":"))))
+            if len(batch) >= batch_size:
+                added += self._insert(batch)
+                batch = []
+        if batch:
+            added += self._insert(batch)
+        return added
+
+    def _insert(self, rows: List[Tuple[str, str]]) -> int:
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("INSERT OR IGNORE INTO tasks (doi, payload) VALUES (?, ?)", rows)
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def claim(self, owner: str, limit: int, visibility_timeout: float) -> List[Tuple[str, Work]]:
+        """
+        Арендует до limit свободных задач (новых или с истёкшей арендой).
+        Задача с истёкшей арендой, уже взятая max_attempts раз, не выдаётся, а помечается failed:
+        скорее всего, она каждый раз обрушивает процесс воркера (например, вместе с Chromium).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                abandoned: int = self._conn.execute(
+                    "UPDATE tasks SET state = ?, owner = NULL, lease_until = 0, "
+                    "error = 'lease expired ' || attempts || ' times' "
+                    "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, LEASED, now, self.max_attempts)
+                ).rowcount
+                rows = self._conn.execute(
+                    "SELECT doi, payload, state FROM tasks "
+                    "WHERE state = ? OR (state = ? AND lease_until < ?) LIMIT ?",
+                    (PENDING, LEASED, now, limit)
+                ).fetchall()
+                expired = sum(1 for _, _, state in rows if state == LEASED)
+                self._conn.executemany(
+                    "UPDATE tasks SET state = ?, owner = ?, lease_until = ?, attempts = attempts + 1 WHERE doi = ?",
+                    [(LEASED, owner, now + visibility_timeout, doi) for doi, _, _ in rows]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if expired:
+            metrics.inc("work_queue.lease_expired", expired)
+        if abandoned:
+            metrics.inc("work_queue.abandoned", abandoned)
+        return [(doi, Work.from_row(json.loads(payload))) for doi, payload, _ in rows]
+
+    def extend(self, owner: str, dois: List[str], visibility_timeout: float) -> None:
+        """Продлевает аренду задач, которые воркер ещё выполняет"""
+        if not dois:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE tasks SET lease_until = ? WHERE doi = ? AND owner = ? AND state = ?",
+                [(time.time() + visibility_timeout, doi, owner, LEASED) for doi in dois]
+            )
+
+    def complete(self, owner: str, doi: str, result: Dict[str, Any]) -> bool:
+        """
+        Сохраняет результат задачи. False, если аренда уже перешла к другому воркеру
+        (результат при этом не записывается: задачу завершит новый владелец).
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET state = ?, result = ?, lease_until = 0 WHERE doi = ? AND owner = ? AND state = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), doi, owner, LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, owner: str, doi: str, error: str) -> None:
+        """Возвращает задачу в очередь после ошибки или помечает failed после max_attempts попыток"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ?, owner = NULL, lease_until = 0 WHERE doi = ? AND owner = ? AND state = ?",
+                (self.max_attempts, FAILED, PENDING, error, doi, owner, LEASED)
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall()
+        return {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+    def unfinished(self) -> int:
+        counts: Dict[str, int] = self.counts()
+        return counts[PENDING] + counts[LEASED]
+
+    def results(self, batch_size: int = 500) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[Work]]]:
+        """
+        Лениво обходит завершённые задачи в порядке DOI: (doi, результат, None) для выполненных
+        и (doi, None, запись Work) для сорвавшихся max_attempts раз
+        """
+        last_doi = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT doi, result, CASE WHEN state = ? THEN payload END FROM tasks "
+                    "WHERE state IN (?, ?) AND doi > ? ORDER BY doi LIMIT ?",
+                    (FAILED, DONE, FAILED, last_doi, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for doi, result, payload in rows:
+                if payload is not None:
+                    yield doi, None, Work.from_row(json.loads(payload))
+                else:
+                    yield doi, json.loads(result), None
+            last_doi = rows[-1][0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def open_work_queue(cfg: Dict[str, Any]) -> WorkQueue:
+    """Открывает очередь из секции "work_queue" (по умолчанию — рядом с хранилищем DOI)"""
+    wq_cfg: Dict[str, Any] = cfg.get("work_queue", {})
+    default_path = os.path.join(os.path.dirname(cfg.get("doi_store_path", "cached_dois.sqlite")), "queue.sqlite")
+    return WorkQueue(wq_cfg.get("path") or default_path, wq_cfg.get("max_attempts", 3))
+
+def run_worker(cfg: Dict[str, Any], worker_id: Optional[str] = None) -> int:
+    """
+    Воркер: забирает DOI из очереди, проверяет их (process_single_doi_item) и записывает
+    результаты обратно. Аренда держится только на выполняемых задачах и продлевается,
+    пока они не завершены. Воркер выходит, когда в очереди не осталось невыполненных задач.
+    Возвращает число выполненных задач.
+    """
+    from playwright_utils import browser_pool
+
+    configure_clients(cfg)
+    wq_cfg: Dict[str, Any] = cfg.get("work_queue", {})
+    visibility_timeout: float = wq_cfg.get("visibility_timeout", 600)
+    poll_interval: float = wq_cfg.get("poll_interval", 2.0)
+    pirate_urls: List[str] = cfg.get("pirate_urls", [])
+    check_rg: bool = cfg.get("check_researchgate", False)
+    deadline: Optional[float] = cfg.get("per_doi_deadline")
+    owner: str = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+
+    queue: WorkQueue = open_work_queue(cfg)
+    result_store = open_result_store(cfg)
+    max_workers: int = get_concurrency_settings()
+    check_workers: int = CHECKS_PER_DOI * max_workers
+    batch_size: int = wq_cfg.get("batch_size") or max_workers
+    completed = 0
+    print(f"Worker {owner} joined queue {queue.path}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+                ThreadPoolExecutor(max_workers=check_workers) as checks_pool:
+            checks = BoundedExecutor(checks_pool, check_workers)
+            pending: Dict[Future, str] = {}
+            last_extend = time.monotonic()
+            while True:
+                # забираем новые задачи, только когда в пуле есть место
+                if len(pending) < max_workers:
+                    for doi, work in queue.claim(owner, min(batch_size, 2 * max_workers - len(pending)),
+                                                 visibility_timeout):
+                        pending[executor.submit(process_single_doi_item, doi, work, pirate_urls, check_rg,
+                                                result_store, checks, deadline)] = doi
+                if not pending:
+                    # задачи других воркеров могут вернуться в очередь по истечении аренды
+                    if queue.unfinished() == 0:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    doi = pending.pop(future)
+                    try:
+                        result: Dict[str, Any] = future.result()
+                    except Exception as e:
+                        print(f"Error processing {doi}: {e}")
+                        metrics.inc("work_queue.failed")
+                        queue.fail(owner, doi, str(e))
+                        continue
+                    if queue.complete(owner, doi, result):
+                        completed += 1
+                        metrics.inc("work_queue.completed")
+                    else:
+                        metrics.inc("work_queue.lost_lease")
+
+                if time.monotonic() - last_extend > visibility_timeout / 3:
+                    queue.extend(owner, list(pending.values()), visibility_timeout)
+                    last_extend = time.monotonic()
+    finally:
+        browser_pool.close_all()
+        result_store.close()
+        queue.close()
+    print(f"Worker {owner} finished: {completed} DOIs")
+    return completed
+
+def _worker_process(cfg: Dict[str, Any], worker_id: str) -> None:
+    run_worker(cfg, worker_id)
+
+@stage_logger("Stage 3: Processing DOIs with worker processes")
+def stage_distributed(cfg: Dict[str, Any], store: Mapping[str, Work],
+                      sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Координатор: ставит DOI из хранилища в очередь, запускает local_workers процессов-воркеров
+    и ждёт, пока будут выполнены все задачи (в том числе взятые воркерами на других машинах,
+    запущенными командой "python cli.py worker" с тем же файлом очереди).
+    Затем результаты передаются в sink (или возвращаются списком) в порядке DOI;
+    DOI, сорвавшиеся max_attempts раз, выгружаются с "unknown", как в других движках.
+    Очередь, оставшаяся от прерванного запуска, продолжается; завершённая — очищается.
+    Если все локальные воркеры завершились раньше очереди, выбрасывается RuntimeError,
+    чтобы неполные результаты не были сохранены как итоговые.
+    """
+    import multiprocessing
+    from tqdm import tqdm
+
+    wq_cfg: Dict[str, Any] = cfg.get("work_queue", {})
+    local_workers: int = wq_cfg.get("local_workers", 2)
+    poll_interval: float = wq_cfg.get("poll_interval", 2.0)
+
+    queue: WorkQueue = open_work_queue(cfg)
+    if queue.unfinished() == 0:
+        queue.clear()
+    added: int = queue.enqueue(store.items())
+    print(f"DOIs queued: {added} new, {queue.unfinished()} to process")
+
+    # spawn: в дочернем процессе не должно быть потоков и соединений родителя
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_worker_process, args=(cfg, f"{socket.gethostname()}:local-{i}"), daemon=True)
+        for i in range(local_workers)
+    ]
+    for process in processes:
+        process.start()
+    if not processes:
+        print(f"Waiting for workers on queue {queue.path}")
+
+    try:
+        counts: Dict[str, int] = queue.counts()
+        with tqdm(total=sum(counts.values()), initial=counts[DONE] + counts[FAILED], ncols=100) as pbar:
+            while True:
+                counts = queue.counts()
+                pbar.update(counts[DONE] + counts[FAILED] - pbar.n)
+                if counts[PENDING] + counts[LEASED] == 0:
+                    break
+                if processes and not any(p.is_alive() for p in processes):
+                    # незавершённая очередь сохраняется: следующий запуск продолжит её
+                    codes = ", ".join(str(p.exitcode) for p in processes)
+                    raise RuntimeError(f"All local workers exited (exit codes {codes}) with "
+                                       f"{counts[PENDING] + counts[LEASED]} DOIs left in {queue.path}")
+                time.sleep(poll_interval)
+        for process in processes:
+            process.join()
+
+        metrics.set_value("work_queue.done", counts[DONE])
+        metrics.set_value("work_queue.failed_tasks", counts[FAILED])
+        if counts[FAILED]:
+            print(f"Warning: {counts[FAILED]} DOIs failed after "
+                  f"{queue.max_attempts} attempts and are exported as unknown")
+
+        pirate_urls: List[str] = cfg.get("pirate_urls", [])
+        check_rg: bool = cfg.get("check_researchgate", False)
+        results = []
+        for doi, result, work in queue.results():
+            if result is None:
+                # как в orchestrator.stage_process_dois: сбойный DOI выгружается с "unknown"
+                result = normalize_item(doi, work, *unknown_checks(pirate_urls, check_rg))
+            if sink is not None:
+                sink(result)
+            else:
+                results.append(result)
+        return results
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        queue.close()